@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Measure how much memory each link takes once a synthetic vault's links, backlinks and
+#   references have been loaded, compared to the old __dict__ based classes.
+#
+#   python benchmarks/memory.py [--notes NOTES] [--links LINKS]
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import zlink.note
+import zlink.parser
+
+from vault import makevault
+
+# Link and Reference as they were before they had __slots__ and interned strings, kept
+#   here as the baseline.
+class LegacyLink():
+    def __init__(self, url, text=None):
+        m = zlink.parser.LINK.search(url)
+        if (m):
+            self.text = m.group(1)
+            self.url = m.group(2)
+        else:
+            self.url = url
+            if (text is None):
+                text = url
+            self.text = text
+        self.url = self.url.replace(' ', '%20')
+
+class LegacyReference():
+    def __init__(self, link, text = None):
+        self.text = text
+        self.link = link
+
+# Build the link graph of every note from its already parsed sections, the same way
+#   Note.parselinks() and Note.parsereferences() do.
+def loadlinks(sections, link_class, reference_class):
+    graph = []
+    for parsed in sections:
+        links = [link_class(url, text) for url, text in zlink.parser.parselinks(parsed.get('links', []))]
+        backlinks = [link_class(url, text) for url, text in zlink.parser.parselinks(parsed.get('backlinks', []))]
+        references = [reference_class(link_class(url, text), quote) for url, text, quote in zlink.parser.parsereferences(parsed.get('references', []))]
+        graph.append((links, backlinks, references))
+    return graph
+
+def measure(sections, link_class, reference_class):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    graph = loadlinks(sections, link_class, reference_class)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    count = sum(len(links) + len(backlinks) + len(references) for links, backlinks, references in graph)
+    return used, count
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bytes per link for a synthetic vault.")
+    parser.add_argument('--notes', help = "number of notes (default: 10000)", type=int, default=10000)
+    parser.add_argument('--links', help = "links per note (default: 10)", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = makevault(directory, notes=args.notes, body=1, links=args.links)
+        sections = []
+        for f in filenames:
+            with open(os.path.join(directory, f), "r") as fh:
+                lines = [line.rstrip() for line in fh]
+            sections.append(zlink.parser.parselines(lines)[0])
+
+    legacy, count = measure(sections, LegacyLink, LegacyReference)
+    new, count = measure(sections, zlink.note.Link, zlink.note.Reference)
+    print(json.dumps({
+        'notes': args.notes,
+        'links': count,
+        'legacy_bytes_per_link': round(legacy / count, 1),
+        'bytes_per_link': round(new / count, 1),
+        'saving': round(1 - new / legacy, 3),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Compare the speed of zlink.parser against the per-line re.search() parser it replaced.
+#
+#   python benchmarks/parser.py [--lines LINES] [--repeat REPEAT]
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import zlink.parser
+
+# The parsing loop from Note.parsefile(), parselinks() and parsereferences() before the
+#   patterns were precompiled, kept here as the baseline.
+def legacyparse(lines):
+    infrontmatter = 0
+    old_tags = []
+    data = {"default": [], "frontmatter":[]}
+    section = "default"
+    for l in lines:
+        m = re.search('^\\[_metadata_:(.+)\\]:- +"?([^"]+)"?$', l)
+        if (m):
+            if (m.group(1) == "tags"):
+                for tag in m.group(2).split(","):
+                    old_tags.append(tag.strip())
+            continue
+
+        m = re.search('^---$', l)
+        if (m and infrontmatter < 2):
+            infrontmatter = infrontmatter + 1
+            continue
+
+        m = re.search("^#+ (.+)$", l)
+        if (m):
+            section = m.group(1).lower()
+            if (section not in data):
+                data[section] = []
+            continue
+
+        if len(data[section]) == 0 and len(l) == 0:
+            continue
+
+        if (infrontmatter == 1):
+            data['frontmatter'].append(l)
+            continue
+
+        data[section].append(l)
+
+    for section in data:
+        if (len(data[section]) > 0):
+            while len(data[section][-1]) == 0:
+                data[section].pop(-1)
+
+    links = []
+    for section in ("links", "backlinks"):
+        for l in data.get(section, []):
+            m = re.search("\\[(.+)\\]\\((.+)\\)", l)
+            if (m):
+                links.append((m.group(2), m.group(1)))
+            else:
+                m = re.search("\\[\\[(.+)\\]\\]", l)
+                if (m):
+                    url,text = m.group(1).split('|')
+                    links.append((url, text))
+
+    references = []
+    link = None
+    quote = None
+    for l in data.get("references", []):
+        if (len(l) == 0 or (link is not None and quote is not None)):
+            if (link):
+                references.append((link[0], link[1], quote))
+            link = None
+            quote = None
+            continue
+        m = re.search("\\[(.+)\\]\\((.+)\\)", l)
+        if (m):
+            link = (m.group(2), m.group(1))
+        m = re.search("^> (.+)$", l)
+        if (m):
+            quote = m.group(1)
+    if (link):
+        references.append((link[0], link[1], quote))
+    return data, old_tags, links, references
+
+def newparse(lines):
+    data, old_tags = zlink.parser.parselines(lines)
+    links = zlink.parser.parselinks(data.get("links", [])) + zlink.parser.parselinks(data.get("backlinks", []))
+    references = zlink.parser.parsereferences(data.get("references", []))
+    return data, old_tags, links, references
+
+# A note with some frontmatter, a long body and a healthy number of links and references,
+#   roughly 'count' lines long.
+def makenote(count):
+    lines = ["---", "tags:", "- one", "- two", "---", ""]
+    body = count // 2
+    links = count // 4
+    references = (count - body - links) // 3
+    for i in range(body):
+        lines.append(f"line {i} of the body, with a [[wiki link|{i}]] mention and some more words to make it wrap")
+    lines.extend(["", "### Links"])
+    for i in range(links):
+        lines.append(f"[Link {i}]({i:04d}%20-%202021-01-01%2012-00%20-%20Link%20{i}.md)")
+    lines.extend(["", "### Backlinks", "", "### References"])
+    for i in range(references):
+        lines.append(f"[Reference {i}](/tmp/reference{i}.txt)")
+        lines.append(f"> quoted text number {i}")
+        lines.append("")
+    return lines
+
+def timeit(parse, lines, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        parse(lines)
+        elapsed = time.perf_counter() - start
+        if (best is None or elapsed < best):
+            best = elapsed
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure lines/sec for the note parser.")
+    parser.add_argument('--lines', help = "lines in the test note (default: 100000)", type=int, default=100000)
+    parser.add_argument('--repeat', help = "runs to take the best time from (default: 5)", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = makenote(args.lines)
+    if (legacyparse(lines) != newparse(lines)):
+        sys.exit("the parsers disagree")
+
+    legacy = timeit(legacyparse, lines, args.repeat)
+    new = timeit(newparse, lines, args.repeat)
+    print(f"{'legacy':<14}{len(lines)/legacy:12,.0f} lines/sec")
+    print(f"{'zlink.parser':<14}{len(lines)/new:12,.0f} lines/sec ({legacy/new:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Compare reading big files through zlink.reader with reading every line into a list first,
+#   the way File and Note.parsefile() used to.
+#
+#   python benchmarks/reader.py [--megabytes MEGABYTES] [--repeat REPEAT]
+
+import argparse
+import curses
+import json
+import os
+import sys
+import tempfile
+import time
+
+import minorimpact
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import zlink.file
+import zlink.reader
+
+from vault import WORDS
+
+def legacylines(filename):
+    lines = []
+    with open(filename, "r") as f:
+        for line in f:
+            lines.append(line.rstrip())
+    return lines
+
+# What File.view() did before it could draw the first screen: read everything, and wrap
+#   everything.
+def legacyscreen(filename, width, rows):
+    output = []
+    for l in legacylines(filename):
+        if (len(l) > 0):
+            output.extend(minorimpact.splitstringlen(l, width))
+        else:
+            output.append(l)
+    return output[:rows]
+
+def readerlines(filename):
+    with zlink.reader.Reader(filename) as reader:
+        return list(reader.lines())
+
+def screen(filename, width, rows):
+    return [line.text for line in zlink.file.File(filename).output(0, rows)]
+
+def timed(repeat, function, *args):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        value = function(*args)
+        elapsed = time.perf_counter() - start
+        if (best is None or elapsed < best):
+            best = elapsed
+    return best, value
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark zlink.reader against reading whole files.")
+    parser.add_argument('--megabytes', help = "size of the test file (default: 50)", type=int, default=50)
+    parser.add_argument('--repeat', help = "take the best of this many runs (default: 3)", type=int, default=3)
+    args = parser.parse_args()
+
+    # File.output() wraps to the width of the screen, which doesn't exist here.
+    curses.COLS = 100
+    width = curses.COLS - 2
+    rows = 50
+
+    results = {'megabytes': args.megabytes}
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "big.md")
+        with open(filename, "w") as f:
+            f.write("---\ntags:\n- one\n- two\ntitle: big\n---\n\n")
+            line = " ".join(WORDS) + "\n"
+            for i in range(args.megabytes * 1024 * 1024 // len(line)):
+                f.write(line)
+
+        for name, legacy, new in (
+                ("lines", legacylines, readerlines),
+                ("first_screen", lambda f: legacyscreen(f, width, rows), lambda f: screen(f, width, rows))):
+            legacy_time, legacy_value = timed(args.repeat, legacy, filename)
+            new_time, new_value = timed(args.repeat, new, filename)
+            if (legacy_value != new_value):
+                raise Exception(f"{name}: results don't match")
+            results[name] = {
+                'legacy_seconds': round(legacy_time, 6),
+                'seconds': round(new_time, 6),
+                'speedup': round(legacy_time / new_time, 1) if (new_time > 0) else None,
+            }
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# Time the expensive note operations against synthetic vaults of different sizes, and
+#   write the results out as JSON so runs from different commits can be compared.
+#
+#   python benchmarks/run.py [--sizes 1000,10000,100000] [--output results.json] [--compare old.json]
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import zlink.globalvars
+import zlink.index
+import zlink.note
+
+from vault import makevault
+
+# How many notes to use for the per-note operations, so the big vaults don't take all day.
+SAMPLE = 200
+
+def gitcommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Start from nothing, as if zlink had just been launched.
+def reset():
+    zlink.note.cache.clear()
+    zlink.index.indexes.clear()
+    zlink.globalvars.filter = ""
+
+def timed(results, name, function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    results[name] = time.perf_counter() - start
+    print(f"  {name:<24}{results[name]:10.4f}s", file=sys.stderr)
+    return value
+
+def bench(size, options):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            print(f"{size} notes", file=sys.stderr)
+            timed(results, "generate", makevault, ".", notes=size, body=options.body, links=options.links, tags=options.tags,
+                references=options.references, frontmatter=options.frontmatter)
+            reset()
+
+            files = timed(results, "loadnotes", zlink.note.loadnotes)
+            sample = files[::max(1, len(files) // SAMPLE)][:SAMPLE]
+
+            # Per note operations are reported as the time for a single note.  Creating a Note
+            #   doesn't read the file any more, so load() it to time the parse as well.
+            start = time.perf_counter()
+            notes = []
+            for f in sample:
+                note = zlink.note.Note(f)
+                note.load()
+                notes.append(note)
+            results["Note.load"] = (time.perf_counter() - start) / len(sample)
+
+            start = time.perf_counter()
+            for note in notes:
+                note.search("zulu yankee xray")
+            results["Note.search"] = (time.perf_counter() - start) / len(sample)
+
+            start = time.perf_counter()
+            for note in notes:
+                note.default.append("one more line")
+                note.write()
+            results["Note.write"] = (time.perf_counter() - start) / len(sample)
+            for name in ("Note.load", "Note.search", "Note.write"):
+                print(f"  {name:<24}{results[name]:10.6f}s/note", file=sys.stderr)
+
+            zlink.globalvars.filter = "zulu yankee"
+            timed(results, "loadnotes_filter_cold", zlink.note.loadnotes)
+            timed(results, "loadnotes_filter_warm", zlink.note.loadnotes)
+            zlink.globalvars.filter = ""
+
+            reset()
+            files = zlink.note.loadnotes()
+            middle = len(files) // 2
+            hole = timed(results, "makehole", zlink.note.makehole, files, middle)
+            zlink.note.newNote(hole, "new note")
+
+            files = zlink.note.loadnotes()
+            timed(results, "swapnotes", zlink.note.swapnotes, files, middle, middle + 1)
+
+            files = zlink.note.loadnotes()
+            note = zlink.note.getnote(files[0])
+            last = zlink.note.parsefilename(files[-1])[0]
+            timed(results, "updateorder", note.updateorder, last + 1)
+
+            timed(results, "defrag_dryrun", zlink.note.defrag, dryrun=True)
+            timed(results, "defrag", zlink.note.defrag)
+        finally:
+            os.chdir(cwd)
+            reset()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark zlink against synthetic vaults.")
+    parser.add_argument('--sizes', help = "comma separated vault sizes (default: 1000,10000,100000)", default="1000,10000,100000")
+    parser.add_argument('--body', help = "lines of text per note (default: 20)", type=int, default=20)
+    parser.add_argument('--links', help = "links per note (default: 3)", type=int, default=3)
+    parser.add_argument('--tags', help = "tags per note (default: 2)", type=int, default=2)
+    parser.add_argument('--references', help = "references per note (default: 1)", type=int, default=1)
+    parser.add_argument('--frontmatter', help = "extra frontmatter keys per note (default: 2)", type=int, default=2)
+    parser.add_argument('--output', help = "write the results to OUTPUT instead of stdout")
+    parser.add_argument('--compare', help = "show how these results compare to an earlier results file")
+    args = parser.parse_args()
+
+    report = {
+        'commit': gitcommit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': { 'body':args.body, 'links':args.links, 'tags':args.tags, 'references':args.references, 'frontmatter':args.frontmatter },
+        'results': {},
+    }
+    for size in [int(s) for s in args.sizes.split(",")]:
+        report['results'][str(size)] = bench(size, args)
+
+    output = json.dumps(report, indent=2)
+    if (args.output is not None):
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if (args.compare is not None):
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+        print(f"compared to {previous.get('commit')}:", file=sys.stderr)
+        for size, results in report['results'].items():
+            for name, seconds in results.items():
+                old = previous['results'].get(size, {}).get(name)
+                if (old is None or seconds == 0):
+                    continue
+                print(f"  {size:>7} {name:<24}{old/seconds:8.2f}x", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
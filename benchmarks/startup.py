@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Measure how long 'import zlink.zlink' takes with 'python -X importtime', which is what
+#   every command line run (--addlink, --defrag, query...) pays before doing anything, and
+#   check that none of the modules only the browser needs get imported along with it.
+#   Exits with an error if the import goes over the budget.
+#
+#   python benchmarks/startup.py [--budget MILLISECONDS] [--repeat REPEAT]
+
+import argparse
+import compileall
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# None of these should be imported until something actually needs them.
+DEFERRED = ["curses", "minorimpact", "yaml", "ctypes", "subprocess"]
+
+# Import zlink.zlink in a fresh interpreter, and return how long it took (in
+#   microseconds, as -X importtime reports it) and which of the DEFERRED modules got
+#   imported along the way.
+def importtime():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import zlink.zlink"], env=env, capture_output=True, text=True, check=True)
+    total = None
+    imported = set()
+    for line in process.stderr.splitlines():
+        if (not line.startswith("import time:")):
+            continue
+        fields = line.split("|")
+        if (len(fields) != 3 or not fields[1].strip().isdigit()):
+            continue
+        name = fields[2].strip()
+        if (name in DEFERRED):
+            imported.add(name)
+        if (name == "zlink.zlink"):
+            total = int(fields[1])
+    return total, sorted(imported)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark how long it takes to import zlink.")
+    parser.add_argument('--budget', help = "fail if importing zlink.zlink takes longer than this many milliseconds (default: 50)", type=float, default=50.0)
+    parser.add_argument('--repeat', help = "take the best of this many runs (default: 10)", type=int, default=10)
+    args = parser.parse_args()
+
+    # Compiling the package is a one-off cost an installed copy doesn't pay on every run,
+    #   so make sure it's already done (PYTHONDONTWRITEBYTECODE would skip it otherwise).
+    compileall.compile_dir(os.path.join(ROOT, "zlink"), quiet=1)
+
+    best = None
+    imported = []
+    for i in range(args.repeat):
+        total, imported = importtime()
+        if (best is None or total < best):
+            best = total
+
+    results = {
+        'import_ms': round(best / 1000, 3),
+        'budget_ms': args.budget,
+        'deferred_imported': imported,
+    }
+    print(json.dumps(results, indent=2))
+
+    if (best / 1000 > args.budget):
+        sys.exit(f"importing zlink.zlink took {best / 1000:.1f}ms, over the {args.budget}ms budget")
+    if (len(imported) > 0):
+        sys.exit(f"importing zlink.zlink pulled in {', '.join(imported)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Build a synthetic zettelkasten for benchmarking.
+#
+#   python benchmarks/vault.py DIRECTORY [--notes NOTES] [--body BODY] [--links LINKS] ...
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import zlink.note
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet", "kilo", "lima",
+    "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango", "uniform", "victor", "whiskey", "xray",
+    "yankee", "zulu"]
+
+# Write 'notes' notes into path, in the same format Note.write() produces.  Each note gets
+#   'body' lines of text, 'links' links to random other notes (with the matching backlinks
+#   on the other end), 'tags' tags drawn from a pool of 'tags' * 10, 'references' quoted
+#   references and 'frontmatter' extra frontmatter keys.  Returns the list of filenames.
+def makevault(path, notes=1000, body=20, links=3, tags=2, references=1, frontmatter=2, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2021, 1, 1)
+    filenames = []
+    titles = []
+    for i in range(notes):
+        id = (start + datetime.timedelta(minutes=i)).strftime("%Y-%m-%d %H-%M")
+        title = " ".join(rng.sample(WORDS, 2)) + f" {i+1}"
+        filenames.append(zlink.note.notefilename(i+1, id, title))
+        titles.append(title)
+
+    outbound = [[] for i in range(notes)]
+    inbound = [[] for i in range(notes)]
+    if (notes > 1):
+        for i in range(notes):
+            for j in range(links):
+                target = rng.randrange(notes)
+                if (target == i):
+                    continue
+                outbound[i].append(target)
+                inbound[target].append(i)
+
+    tag_pool = [f"tag{i}" for i in range(max(1, tags * 10))]
+    for i in range(notes):
+        data = {'tags': rng.sample(tag_pool, min(tags, len(tag_pool)))}
+        for j in range(frontmatter):
+            data[f"key{j}"] = " ".join(rng.choices(WORDS, k=3))
+
+        lines = ["---", yaml.dump(data), "---", ""]
+        for j in range(body):
+            lines.append(" ".join(rng.choices(WORDS, k=12)))
+        lines.append("")
+
+        lines.append("### Links")
+        for target in outbound[i]:
+            lines.append(f"{zlink.note.Link(filenames[target], titles[target])}")
+        lines.append("")
+
+        lines.append("### Backlinks")
+        for source in inbound[i]:
+            lines.append(f"{zlink.note.Link(filenames[source], titles[source])}")
+        lines.append("")
+
+        lines.append("### References")
+        for j in range(references):
+            lines.append(f"[reference {j}](https://example.com/{i}/{j})")
+            lines.append("> " + " ".join(rng.choices(WORDS, k=8)))
+            lines.append("")
+        lines.append("")
+
+        with open(os.path.join(path, filenames[i]), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    return filenames
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a synthetic zettelkasten for benchmarking.")
+    parser.add_argument('directory')
+    parser.add_argument('--notes', help = "number of notes (default: 1000)", type=int, default=1000)
+    parser.add_argument('--body', help = "lines of text per note (default: 20)", type=int, default=20)
+    parser.add_argument('--links', help = "links per note (default: 3)", type=int, default=3)
+    parser.add_argument('--tags', help = "tags per note (default: 2)", type=int, default=2)
+    parser.add_argument('--references', help = "references per note (default: 1)", type=int, default=1)
+    parser.add_argument('--frontmatter', help = "extra frontmatter keys per note (default: 2)", type=int, default=2)
+    parser.add_argument('--seed', help = "random seed (default: 0)", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    filenames = makevault(args.directory, notes=args.notes, body=args.body, links=args.links, tags=args.tags,
+        references=args.references, frontmatter=args.frontmatter, seed=args.seed)
+    print(f"Wrote {len(filenames)} notes to {args.directory}")
+
+if __name__ == "__main__":
+    main()
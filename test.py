@@ -1,11 +1,27 @@
 #!/usr/bin/env python3
 
+import curses
+import minorimpact
 import os
 import random
 import re
+import sys
 import tempfile
+import threading
+import time
 import unittest
+import zlink.cache
+import zlink.file
+import zlink.globalvars
+import zlink.index
+import zlink.lazy
 import zlink.note
+import zlink.notelist
+import zlink.parser
+import zlink.reader
+import zlink.render
+import zlink.watcher
+import zlink.zlink
 
 # https://docs.python.org/3/library/unittest.html
 # test fixture
@@ -68,8 +84,8 @@ class TestNote(unittest.TestCase):
         self.assertEqual(zlink.note.Note(notes[1]).title, "TWO")
 
         # swap them around
-        zlink.note.swapnotes(notes,0,1)
-        notes = zlink.note.loadnotes()
+        notes = zlink.note.swapnotes(notes,0,1)
+        self.assertEqual(notes, zlink.note.loadnotes())
         self.assertEqual(zlink.note.Note(notes[0]).title, "TWO")
         self.assertEqual(zlink.note.Note(notes[1]).title, "ONE")
 
@@ -165,6 +181,659 @@ class TestNote(unittest.TestCase):
         notes = zlink.note.loadnotes()
         self.assertEqual(len(notes), 3)
 
+    def test_005_index(self):
+        # the index should only pick up the notes that changed since the last refresh
+        note1 = zlink.note.newNote(1, "ONE")
+        note1.default = ["this is data for note number one"]
+        note1.write()
+        note2 = zlink.note.newNote(2, "TWO")
+
+        index = zlink.index.getindex()
+        self.assertEqual(index.refresh(), [note1.filename, note2.filename])
+        self.assertEqual(index.get(note1.filename)['default'], ["this is data for note number one"])
+        self.assertEqual(index.search("data"), [note1.filename])
+
+        note2.default = ["this is data for note number two"]
+        note2.write()
+        index.refresh()
+        self.assertEqual(index.search("data"), [note1.filename, note2.filename])
+
+        note1.delete()
+        index.refresh()
+        self.assertIsNone(index.get(note1.filename))
+        self.assertEqual(index.search("data"), [note2.filename])
+
+    def test_006_cache(self):
+        # unchanged notes should come back from the cache, changed ones get re-read
+        note1 = zlink.note.newNote(1, "ONE")
+        cached = zlink.note.cache.get(note1.filename)
+        self.assertIsNotNone(cached)
+        self.assertIsNot(cached, note1)
+        copy1 = zlink.note.getnote(note1.filename)
+        self.assertIs(zlink.note.cache.get(note1.filename), cached)
+        self.assertIsNot(copy1, note1)
+        self.assertEqual(str(copy1), str(note1))
+
+        # every caller gets its own copy, so changing one without writing it doesn't leak
+        copy1.default.append("not written")
+        copy1.frontmatter['tags'].append("unwritten")
+        copy1.addlink(zlink.note.Link("0002 - 2 - TWO.md"))
+        copy2 = zlink.note.getnote(note1.filename)
+        self.assertEqual(str(copy2), str(note1))
+        self.assertNotEqual(str(copy1), str(note1))
+
+        with open(note1.filename, "w") as f:
+            f.write("changed behind our back\n")
+        new_note = zlink.note.getnote(note1.filename)
+        self.assertIsNot(new_note, note1)
+        self.assertEqual(new_note.default, ["changed behind our back"])
+
+        original_file = new_note.filename
+        new_note.updateorder(2)
+        self.assertIsNone(zlink.note.cache.get(original_file))
+
+        cache = zlink.cache.NoteCache(maxsize=1)
+        note2 = zlink.note.newNote(3, "THREE")
+        cache.put(new_note.filename, new_note)
+        cache.put(note2.filename, note2)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNone(cache.get(new_note.filename))
+        self.assertIs(cache.get(note2.filename), note2)
+
+    def test_007_referrers(self):
+        # moving a note should only rewrite the notes that link to it
+        note1 = zlink.note.newNote(1, "ONE")
+        note2 = zlink.note.newNote(2, "TWO")
+        note3 = zlink.note.newNote(3, "THREE")
+        note1.addnotelink(note2)
+        note1.write()
+        note2.addnotebacklink(note1)
+        note2.write()
+
+        index = zlink.index.getindex()
+        index.refresh()
+        self.assertEqual(index.referrers(note2.filename), [note1.filename])
+        self.assertEqual(index.referrers(note3.filename), [])
+
+        # only the moved note and the notes linking to it get read again, not the whole vault
+        os.utime(note3.filename, ns=(0, 0))
+        scan = index.scan
+        index.scan = None
+        try:
+            note2.updateorder(4)
+            self.assertEqual(os.stat(note3.filename).st_mtime_ns, 0)
+            test_note = zlink.note.Note(note1.filename)
+            self.assertTrue(test_note.links[0].equals(note2.filename))
+            self.assertEqual(index.referrers(note2.filename), [note1.filename])
+            self.assertEqual(index.get(note2.filename)['order'], 4)
+            self.assertEqual(index.pending(), set())
+        finally:
+            index.scan = scan
+
+    def test_008_renumber(self):
+        # renumbering a batch of notes should rename them all and fix their links in one pass
+        note1 = zlink.note.newNote(3, "ONE")
+        note2 = zlink.note.newNote(7, "TWO")
+        note1.addnotelink(note2)
+        note1.write()
+
+        moves = {note1.filename:1, note2.filename:2}
+        renames, rewrites = zlink.note.renumber(moves, dryrun=True)
+        self.assertEqual(len(renames), 2)
+        self.assertEqual(rewrites, [renames[note1.filename]])
+        self.assertEqual(zlink.note.loadnotes(), [note1.filename, note2.filename])
+
+        renames, rewrites = zlink.note.renumber(moves)
+        notes = zlink.note.loadnotes()
+        self.assertEqual([zlink.note.Note(f).order for f in notes], [1, 2])
+        test_note = zlink.note.Note(notes[0])
+        self.assertTrue(test_note.links[0].equals(notes[1]))
+
+    def test_009_dirtywrites(self):
+        # writing a note that hasn't changed shouldn't touch the file
+        note1 = zlink.note.newNote(1, "ONE")
+        note2 = zlink.note.newNote(2, "TWO")
+        os.utime(note1.filename, ns=(0, 0))
+        stats = dict(zlink.note.writestats)
+
+        test_note = zlink.note.Note(note1.filename)
+        test_note.write()
+        test_note.updatelinks(note2.filename, None)
+        self.assertEqual(os.stat(note1.filename).st_mtime_ns, 0)
+        self.assertEqual(zlink.note.writestats['skipped'], stats['skipped'] + 2)
+        self.assertEqual(zlink.note.writestats['performed'], stats['performed'])
+
+        test_note.addnotelink(note2)
+        test_note.write()
+        self.assertNotEqual(os.stat(note1.filename).st_mtime_ns, 0)
+        self.assertEqual(zlink.note.writestats['performed'], stats['performed'] + 1)
+
+    def test_010_atomicwrite(self):
+        # writes go through a temporary file that replaces the note, keeping its permissions
+        note1 = zlink.note.newNote(1, "ONE")
+        self.assertEqual(os.stat(note1.filename).st_mode & 0o777, 0o666 & ~zlink.note.UMASK)
+        os.chmod(note1.filename, 0o640)
+        with zlink.note.batchwrites():
+            note1.default = ["some data"]
+            note1.write()
+            self.assertEqual(zlink.note.syncdirs, set([os.getcwd()]))
+        self.assertIsNone(zlink.note.syncdirs)
+
+        self.assertEqual(os.listdir("."), [note1.filename])
+        self.assertEqual(os.stat(note1.filename).st_mode & 0o777, 0o640)
+        self.assertEqual(zlink.note.Note(note1.filename).default, ["some data"])
+
+    def test_011_parallel(self):
+        # parsing notes across workers should give the same records as doing it one at a time
+        for i in range(1, 6):
+            note = zlink.note.newNote(i, f"NOTE{i}")
+            note.default = [f"this is note {i}"]
+            note.write()
+        notes = zlink.note.loadnotes()
+
+        records = zlink.index.parserecords(notes, workers=1)
+        self.assertEqual([r['title'] for r in records], [f"NOTE{i}" for i in range(1, 6)])
+        self.assertEqual(zlink.index.parserecords(list(notes) + ["invalid filename"], workers=2), records + [None])
+
+        zlink.globalvars.executor = "thread"
+        self.assertEqual(zlink.index.parserecords(notes, workers=2), records)
+        zlink.globalvars.executor = "process"
+
+    def test_012_searchindex(self):
+        # the word and tag postings should narrow a search down without changing the results
+        note1 = zlink.note.newNote(1, "ONE")
+        note1.default = ["this is data for note number one"]
+        note1.write()
+        note2 = zlink.note.newNote(2, "TWO")
+        note2.default = ["this is garbage for note number two"]
+        note2.frontmatter['tags'] = ["datatag"]
+        note2.write()
+        note3 = zlink.note.newNote(3, "THREE")
+
+        index = zlink.index.getindex()
+        index.refresh()
+        self.assertEqual([r['filename'] for r in index.candidates("dat")], [note1.filename, note2.filename])
+        self.assertEqual([r['filename'] for r in index.candidates("ata one")], [note1.filename])
+        self.assertEqual(index.search("ata tag"), [])
+        self.assertEqual(index.search("r note n"), [note1.filename, note2.filename])
+        self.assertEqual(index.search("t(wo|hree)"), [note2.filename, note3.filename])
+        self.assertEqual(index.search("th(ree|is is d)"), [note1.filename, note3.filename])
+
+        # postings follow a note that changes or goes away, and don't outlive it
+        note1.default = ["nothing to see"]
+        note1.write()
+        note3.delete()
+        index.refresh()
+        self.assertEqual([r['filename'] for r in index.candidates("dat")], [note2.filename])
+        for table in ("tokens", "tags"):
+            self.assertEqual(index.db.execute(f"SELECT COUNT(*) FROM {table} WHERE note NOT IN (SELECT note FROM notes)").fetchone()[0], 0)
+
+    def test_013_lazynote(self):
+        # the file shouldn't be read until something other than the filename is needed
+        note1 = zlink.note.newNote(1, "ONE")
+        test_note = zlink.note.Note(note1.filename)
+        self.assertEqual(test_note.order, 1)
+        self.assertEqual(test_note.title, "ONE")
+
+        note1.default = ["added after the note was opened"]
+        note1.write()
+        self.assertEqual(test_note.default, ["added after the note was opened"])
+
+        # text assigned before the file is read survives the read
+        test_note = zlink.note.Note(note1.filename)
+        test_note.default = ["replaced"]
+        self.assertEqual(test_note.linkcount(), 0)
+        self.assertEqual(test_note.default, ["replaced"])
+
+        test_note.reload()
+        self.assertEqual(test_note.default, ["added after the note was opened"])
+
+    def test_014_watcher(self):
+        note1 = zlink.note.newNote(1, "ONE")
+        note2 = zlink.note.newNote(2, "TWO")
+        files = zlink.note.loadnotes()
+        for polling in (False, True):
+            watcher = zlink.watcher.Watcher(".", match=zlink.parser.NOTEFILE.search, poll=polling)
+            self.assertEqual(watcher.events(), [])
+
+            note3 = zlink.note.newNote(3, "THREE")
+            self.assertTrue(watcher.changed())
+            files = zlink.note.applyevents(files, watcher.events())
+            self.assertEqual(files, [note1.filename, note2.filename, note3.filename])
+
+            note1.updatetitle("UNO")
+            note3.delete()
+            files = zlink.note.applyevents(files, watcher.events())
+            self.assertEqual(files, [note1.filename, note2.filename])
+            self.assertEqual(zlink.index.getindex().search("uno"), [note1.filename])
+            self.assertEqual(files, zlink.note.loadnotes())
+
+            # polling only looks at every note now and then, unless the directory changes
+            if (polling):
+                self.assertEqual(watcher.events(), [])
+                with open(note2.filename, "a") as f:
+                    f.write("edited in place\n")
+                self.assertEqual(watcher.events(), [])
+                interval = zlink.watcher.RESCAN_INTERVAL
+                zlink.watcher.RESCAN_INTERVAL = 0
+                try:
+                    self.assertEqual(watcher.events(), [("modified", note2.filename, None)])
+                finally:
+                    zlink.watcher.RESCAN_INTERVAL = interval
+            watcher.close()
+
+    def test_015_backgroundrefresh(self):
+        notes = [zlink.note.newNote(i, f"NOTE {i}") for i in range(1, 6)]
+        loader = zlink.index.backgroundrefresh()
+        loader.wait()
+        self.assertFalse(loader.running())
+        self.assertEqual((loader.done, loader.total), (5, 5))
+        index = zlink.index.getindex()
+        self.assertEqual(len(list(index.records())), 5)
+        self.assertEqual(index.search("note 3"), [notes[2].filename])
+
+        # progress is reported for every note, not just every STORE_BATCH of them
+        os.utime(notes[0].filename, ns=(1, 1))
+        os.utime(notes[1].filename, ns=(1, 1))
+        calls = []
+        index.refresh(progress=lambda done, total: calls.append((done, total)))
+        self.assertEqual(calls, [(1, 2), (2, 2)])
+
+        # while a loader is busy, nothing waits for it: whatever it hasn't stored yet is
+        #   read straight from disk
+        notes[3].addnotelink(notes[0])
+        notes[3].write()
+        busy = threading.Event()
+        loader = zlink.index.Loader(".")
+        loader.thread = threading.Thread(target=busy.wait, daemon=True)
+        loader.changed = [notes[3].filename]
+        loader.scanned.set()
+        zlink.index.loaders[index.path] = loader
+        loader.thread.start()
+        try:
+            self.assertEqual(index.referrers(notes[0].filename), [notes[3].filename])
+            self.assertEqual(index.refresh(), [n.filename for n in notes])
+            self.assertIn(notes[3].filename, index.pending())
+
+            # asking about a lot of notes at once still only reads each pending note once
+            loader.changed = [n.filename for n in notes]
+            loadrecord = zlink.index.loadrecord
+            reads = []
+            zlink.index.loadrecord = lambda f: reads.append(f) or loadrecord(f)
+            try:
+                self.assertEqual(index.referrers([n.filename for n in notes]), [notes[3].filename])
+            finally:
+                zlink.index.loadrecord = loadrecord
+            self.assertLessEqual(len(reads), len(notes))
+        finally:
+            busy.set()
+            loader.thread.join()
+            del zlink.index.loaders[index.path]
+
+        # until a loader has scanned the directory, nothing in the index can be trusted, so
+        #   anything asking waits for the scan (a note changed outside zlink since the last
+        #   run has to show up)
+        index.refresh()
+        with open(notes[2].filename, "a") as f:
+            f.write(f"\n[{notes[1].title}]({notes[1].filename.replace(' ', '%20')})\n")
+        os.utime(notes[2].filename, ns=(2, 2))
+        scanning = threading.Event()
+        scan = zlink.index.NoteIndex.scan
+        def slowscan(self):
+            if (threading.current_thread() is not threading.main_thread()):
+                scanning.set()
+                time.sleep(0.2)
+            return scan(self)
+        zlink.index.NoteIndex.scan = slowscan
+        try:
+            loader = zlink.index.backgroundrefresh()
+            scanning.wait()
+            self.assertIn(notes[2].filename, index.referrers(notes[1].filename))
+        finally:
+            zlink.index.NoteIndex.scan = scan
+            loader.wait()
+            del zlink.index.loaders[index.path]
+
+        # stopping part way through keeps what was already stored
+        def cancel(done, total):
+            if (done == 3):
+                raise zlink.index.RefreshCancelled()
+        os.remove(zlink.globalvars.index_filename)
+        store_batch = zlink.index.STORE_BATCH
+        zlink.index.STORE_BATCH = 2
+        try:
+            index = zlink.index.NoteIndex(".")
+            with self.assertRaises(zlink.index.RefreshCancelled):
+                index.refresh(progress=cancel)
+            index.db.rollback()
+            self.assertEqual(len(list(index.records())), 2)
+        finally:
+            zlink.index.STORE_BATCH = store_batch
+
+    def test_016_rendercache(self):
+        curses.COLS = 40
+        curses.LINES = 10
+        note1 = zlink.note.newNote(1, "ONE")
+        note2 = zlink.note.newNote(2, "TWO")
+        note1.default = ["word " * 20] + [f"line {i}" for i in range(20)]
+        note1.addnotelink(note2)
+        note1.write()
+
+        lines = note1.renderlines()
+        self.assertIs(note1.renderlines(), lines)
+        self.assertTrue(all(len(line.text) < curses.COLS for line in lines))
+        self.assertEqual([line.text for line in lines if (line.link == 1)], ["TWO"])
+
+        # only the lines that fit get drawn, with the selected link reversed
+        class Screen():
+            def __init__(self):
+                self.drawn = []
+            def addstr(self, s, attr=0):
+                self.drawn.append((s, attr))
+        screen = Screen()
+        self.assertEqual(note1.cursesoutput(screen), 1)
+        self.assertLessEqual(len(screen.drawn), curses.LINES - 2)
+        self.assertIn(("TWO\n", curses.A_REVERSE), screen.drawn)
+
+        note1.addnotebacklink(note2)
+        self.assertIsNot(note1.renderlines(), lines)
+        curses.COLS = 80
+        lines = note1.renderlines()
+        self.assertEqual(len([line for line in lines if (line.link > 0)]), 2)
+
+        # text that looks like the old formatting markers is just text
+        note1.default = ["__REVERSE__not reversed", "__1__not a link"]
+        note1.write()
+        self.assertIn(zlink.render.Line("__REVERSE__not reversed"), note1.renderlines())
+        self.assertIn(zlink.render.Line("__1__not a link"), note1.renderlines())
+
+    def test_017_fileview(self):
+        curses.COLS = 22
+        curses.LINES = 10
+        lines = []
+        for i in range(1000):
+            lines.append(f"{i} " + "x" * (i % 50) + ("\tend" if (i % 7 == 0) else ""))
+            if (i % 10 == 0):
+                lines.append("")
+        with open("big.txt", "w") as f:
+            f.write("\n".join(lines))
+
+        wrapped = []
+        for l in lines:
+            wrapped.extend(minorimpact.splitstringlen(l, curses.COLS - 2) if (len(l) > 0) else [l])
+
+        file = zlink.file.File("big.txt")
+        self.assertEqual([l.text for l in file.output(0, 8)], wrapped[0:8])
+        # only as much of the file as has been looked at gets indexed
+        self.assertLess(len(file.rowoffsets), len(wrapped))
+        self.assertEqual([l.text for l in file.output(500, 8)], wrapped[500:508])
+        self.assertEqual(file.lines(curses.COLS - 2), len(wrapped))
+        self.assertEqual([l.text for l in file.output(len(wrapped) - 3, 8)], wrapped[-3:])
+        self.assertEqual(file.lines(), len(lines))
+
+        with open("empty.txt", "w") as f:
+            pass
+        self.assertEqual(zlink.file.File("empty.txt").output(), [])
+
+    def test_018_reader(self):
+        with open("lines.txt", "wb") as f:
+            f.write(b"one  \r\ntwo\n\nthree\rfour")
+        with zlink.reader.Reader("lines.txt") as reader:
+            self.assertEqual(list(reader.lines()), ["one", "two", "", "three", "four"])
+            self.assertEqual(reader.getline(7), ("two", 11))
+
+        # big files get mapped, and read the same way, a chunk at a time
+        with open("big.txt", "wb") as f:
+            f.write(b"---\r\n" + b"x" * (zlink.reader.CHUNK_SIZE - 6) + b"\r\n" + b"x" * zlink.reader.MMAP_THRESHOLD + b"\n---\n")
+        with zlink.reader.Reader("big.txt") as reader:
+            self.assertEqual([len(l) for l in reader.lines()], [3, zlink.reader.CHUNK_SIZE - 6, zlink.reader.MMAP_THRESHOLD, 3])
+
+        # notes are parsed straight from the reader
+        note1 = zlink.note.newNote(1, "ONE")
+        note1.default = ["some data"]
+        note1.write()
+        with open(note1.filename, "rb") as f:
+            data = f.read()
+        with open(note1.filename, "wb") as f:
+            f.write(data.replace(b"\n", b"\r\n"))
+        test_note = zlink.note.Note(note1.filename)
+        self.assertEqual(test_note.default, ["some data"])
+        self.assertEqual(test_note.frontmatter['tags'], [])
+
+    def test_019_notelist(self):
+        # notes past 9999 sort by their order, not their name
+        files = zlink.notelist.NoteList(["10000 - id - TEN THOUSAND.md", "9999 - id - NINE.md", "0002 - id - TWO.md"])
+        self.assertEqual(files, ["0002 - id - TWO.md", "9999 - id - NINE.md", "10000 - id - TEN THOUSAND.md"])
+        self.assertEqual(files.index("9999 - id - NINE.md"), 1)
+        self.assertEqual(files[::2], ["0002 - id - TWO.md", "10000 - id - TEN THOUSAND.md"])
+        self.assertEqual(files[-1], "10000 - id - TEN THOUSAND.md")
+        self.assertEqual(files.neighbors(9999), ("0002 - id - TWO.md", "10000 - id - TEN THOUSAND.md"))
+        self.assertEqual(files.neighbors(1), (None, "0002 - id - TWO.md"))
+        with self.assertRaises(ValueError):
+            files.index("0003 - id - THREE.md")
+
+        # the next free order has to agree with walking the list, as notes come and go
+        def hole(orders, position):
+            next_order = orders[position] + 1
+            for order in orders[position:]:
+                if (order > next_order):
+                    break
+                next_order = order + 1
+            return next_order
+
+        # small blocks, so they get split and emptied along the way
+        load = zlink.notelist.SortedBlocks.LOAD
+        zlink.notelist.SortedBlocks.LOAD = 4
+        try:
+            rng = random.Random(0)
+            files = zlink.notelist.NoteList()
+            filenames = set()
+            for i in range(500):
+                filename = zlink.note.notefilename(rng.randint(1, 60), "id", f"NOTE {rng.randint(1, 3)}")
+                if (filename in files):
+                    files.discard(filename)
+                    filenames.discard(filename)
+                else:
+                    files.add(filename)
+                    filenames.add(filename)
+                self.assertEqual(files, zlink.notelist.NoteList(filenames))
+                orders = [files.order(j) for j in range(len(files))]
+                self.assertEqual(orders, sorted(orders))
+                for position in range(len(files)):
+                    self.assertEqual(files.gethole(position), hole(orders, position))
+        finally:
+            zlink.notelist.SortedBlocks.LOAD = load
+
+    def test_020_spacing(self):
+        zlink.globalvars.spacing = 10
+        try:
+            note1 = zlink.note.newNote(10, "ONE")
+            note2 = zlink.note.newNote(20, "TWO")
+            note1.addnotelink(note2)
+            note1.write()
+            original = zlink.note.loadnotes()
+
+            # room between two notes means nothing gets renamed
+            hole = zlink.note.makehole(original, 1)
+            self.assertEqual(hole, 15)
+            self.assertEqual(zlink.note.loadnotes(), original)
+            note3 = zlink.note.newNote(hole, "THREE")
+            self.assertEqual(zlink.note.makehole(zlink.note.loadnotes(), 0), 5)
+            self.assertEqual(zlink.note.makehole(zlink.note.loadnotes(), 3), 30)
+
+            # without any room, notes still get moved out of the way
+            zlink.note.newNote(16, "FOUR")
+            files = zlink.note.loadnotes()
+            hole = zlink.note.makehole(files, 2)
+            self.assertEqual(hole, 16)
+            # the notes that got moved are moved in the list that was passed in, too
+            self.assertEqual(files, zlink.note.loadnotes())
+            self.assertNotIn(16, [files.order(i) for i in range(len(files))])
+
+            zlink.note.rebalance()
+            files = zlink.note.loadnotes()
+            self.assertEqual([files.order(i) for i in range(len(files))], [10, 20, 30, 40])
+            self.assertEqual([zlink.note.Note(f).title for f in files], ["ONE", "THREE", "FOUR", "TWO"])
+            self.assertEqual(zlink.note.Note(files[0]).links[0].url, files[3].replace(" ", "%20"))
+        finally:
+            zlink.globalvars.spacing = 1
+
+    def test_021_addlinks(self):
+        note1 = zlink.note.newNote(1, "ONE")
+        note2 = zlink.note.newNote(2, "TWO")
+        note3 = zlink.note.newNote(3, "THREE")
+        pairs = [(note1.filename, note2.filename), (note1.filename, note3.filename), (note2.filename, note3.filename), (note1.filename, note2.filename), (note1.filename, "0004 - FOUR.md")]
+        summary = zlink.note.addlinks(pairs)
+        self.assertEqual(summary['links'], 3)
+        self.assertEqual(summary['backlinks'], 3)
+        self.assertEqual(summary['existing'], 2)
+        self.assertEqual(summary['notes'], 3)
+        self.assertEqual(len(summary['errors']), 1)
+
+        zlink.note.cache.clear()
+        self.assertEqual([l.text for l in zlink.note.Note(note1.filename).links], ["TWO", "THREE"])
+        self.assertEqual([l.text for l in zlink.note.Note(note3.filename).backlinks], ["ONE", "TWO"])
+        self.assertEqual(len(zlink.note.Note(note2.filename).links), 1)
+
+        # running it again doesn't change anything
+        summary = zlink.note.addlinks(pairs[:3], backlinks=False)
+        self.assertEqual((summary['links'], summary['backlinks'], summary['notes']), (0, 0, 0))
+
+        # a file that isn't there is a one line error, not a traceback
+        argv = sys.argv
+        sys.argv = ["zlink", "--addlinks", "missing.txt"]
+        try:
+            with self.assertRaises(SystemExit) as e:
+                zlink.zlink.main()
+            self.assertEqual(e.exception.code, "can't read missing.txt: No such file or directory")
+        finally:
+            sys.argv = argv
+
+    def test_022_query(self):
+        note1 = zlink.note.newNote(1, "ONE")
+        note1.default = ["this is data for note number one"]
+        note1.frontmatter['tags'] = ["Red", "blue"]
+        note1.write()
+        note2 = zlink.note.newNote(2, "TWO")
+        note2.frontmatter['tags'] = ["red"]
+        note2.write()
+        note3 = zlink.note.newNote(3, "THREE")
+        zlink.note.addlinks([(note2.filename, note3.filename)])
+
+        index = zlink.index.getindex()
+        index.refresh()
+        def query(**kwargs):
+            return [r['filename'] for r in index.query(**kwargs)]
+        self.assertEqual(query(), [note1.filename, note2.filename, note3.filename])
+        self.assertEqual(query(tags=["red"]), [note1.filename, note2.filename])
+        self.assertEqual(query(tags=["red", "blue"]), [note1.filename])
+        self.assertEqual(query(links_to=note3.filename), [note2.filename])
+        self.assertEqual(query(tags=["red"], search_string="n(umber|othing)"), [note1.filename])
+        self.assertEqual(query(search_string="t(wo|hree)"), index.search("t(wo|hree)"))
+
+        record = zlink.index.jsonrecord(index.get(note2.filename))
+        self.assertEqual(record['title'], "TWO")
+        self.assertEqual(record['links'], [{'url':note3.filename.replace(" ", "%20"), 'text':"THREE"}])
+
+        # a file called 'query' is opened like any other file, not taken as the subcommand
+        argv = sys.argv
+        sys.argv = ["zlink", "query", "--addlinks", "missing.txt"]
+        try:
+            with self.assertRaises(SystemExit) as e:
+                zlink.zlink.main()
+            self.assertEqual(e.exception.code, 2)
+            with open("query", "w") as f:
+                f.write("")
+            with self.assertRaises(SystemExit) as e:
+                zlink.zlink.main()
+            self.assertEqual(e.exception.code, "can't read missing.txt: No such file or directory")
+        finally:
+            sys.argv = argv
+
+    def test_023_lazy(self):
+        # a lazy module is the real module as soon as anything looks at it
+        lazy = zlink.lazy.LazyModule("curses")
+        self.assertEqual(lazy.A_BOLD, curses.A_BOLD)
+        lazy.COLS = 123
+        self.assertEqual(curses.COLS, 123)
+        curses.COLS = 100
+        self.assertEqual(lazy.COLS, 100)
+        with self.assertRaises(AttributeError):
+            lazy.nothing_called_this
+
+        splitstringlen = zlink.lazy.lazyfunction("minorimpact", "splitstringlen")
+        self.assertEqual(splitstringlen("one two three", 8), minorimpact.splitstringlen("one two three", 8))
+
+    def test_024_settings(self):
+        # --spacing sticks with the vault, even when the rest of the index gets rebuilt
+        index = zlink.index.getindex()
+        self.assertIsNone(index.getsetting('spacing'))
+        index.setsetting('spacing', 10)
+        index.db.execute("PRAGMA user_version = 0")
+        index.db.commit()
+        self.assertEqual(zlink.index.NoteIndex(".").getsetting('spacing'), 10)
+
+    def test_025_padding(self):
+        # a note past 9999 pads every note out, so the filenames still sort in order
+        try:
+            note1 = zlink.note.newNote(1, "ONE")
+            note2 = zlink.note.newNote(9999, "TWO")
+            note1.addnotelink(note2)
+            note1.write()
+            files = zlink.note.loadnotes()
+            hole = zlink.note.makehole(files, 2)
+            self.assertEqual(hole, 10000)
+            zlink.note.newNote(hole, "THREE")
+            files = zlink.note.loadnotes()
+            self.assertEqual(list(files), sorted(files))
+            self.assertEqual([f.split(" - ")[0] for f in files], ["00001", "09999", "10000"])
+            self.assertEqual(zlink.note.getnote(files[0]).links[0].url, files[1].replace(" ", "%20"))
+
+            # defragging shrinks the padding back down, unless it's a dry run
+            renames, rewrites = zlink.note.defrag(dryrun=True)
+            self.assertEqual(renames[files[2]].split(" - ")[0], "0003")
+            self.assertEqual(zlink.globalvars.order_width, 5)
+            zlink.note.defrag()
+            files = zlink.note.loadnotes()
+            self.assertEqual([f.split(" - ")[0] for f in files], ["0001", "0002", "0003"])
+            self.assertEqual(zlink.note.getnote(files[0]).links[0].url, files[1].replace(" ", "%20"))
+        finally:
+            zlink.globalvars.order_width = 4
+
+    def test_026_brokennotes(self):
+        # a note that can't be parsed doesn't break the index for everything else
+        note1 = zlink.note.newNote(1, "ONE")
+        note1.default = ["hello"]
+        note1.write()
+        note2 = zlink.note.newNote(2, "TWO")
+        note3 = zlink.note.newNote(3, "THREE")
+        note3.default = ["hello"]
+        note3.write()
+        index = zlink.index.getindex()
+        index.refresh()
+        self.assertEqual(index.search("hello"), [note1.filename, note3.filename])
+
+        with open(note1.filename, "w") as f:
+            f.write("---\ntags: [hello\n---\nhello\n")
+        with open(note2.filename, "wb") as f:
+            f.write(b"hello \xff\xfe\n")
+        index.refresh()
+        # the old contents of a note that broke aren't returned any more
+        self.assertEqual(index.search("hello"), [note3.filename])
+        self.assertEqual(index.get(note1.filename)['title'], "ONE")
+        # and it isn't parsed again until it changes
+        current, changed, removed = index.scan()
+        self.assertEqual((changed, removed), ([], []))
+
+        # nor does it stop a background refresh part way through
+        os.utime(note1.filename, ns=(1, 1))
+        os.utime(note2.filename, ns=(1, 1))
+        loader = zlink.index.backgroundrefresh()
+        loader.wait()
+        del zlink.index.loaders[index.path]
+        self.assertTrue(loader.finished)
+        self.assertEqual(loader.total, 2)
+
     # TODO:
     #        Write a test to focus on data.
     #           - tags, references, backlinks and whatnot
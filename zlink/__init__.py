@@ -1,5 +1,5 @@
-from . import zlink
-
+# zlink.zlink (and everything it imports) only gets loaded when it's actually run, so
+#   importing one piece of the package doesn't cost as much as starting the whole thing.
 def main():
+   from . import zlink
    zlink.main()
-
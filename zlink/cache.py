@@ -0,0 +1,79 @@
+import collections
+import logging
+import os
+import os.path
+
+import zlink
+import zlink.globalvars
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry overhead on top of the file size, so a vault full of tiny notes
+#   still gets evicted eventually.
+ENTRY_OVERHEAD = 1024
+
+class NoteCache():
+    def __init__(self, maxsize=None):
+        # Keyed on the absolute path, each entry is ((mtime, size), cost, note).
+        self.entries = collections.OrderedDict()
+        self.maxsize = maxsize
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    # Return the cached object for filename, as long as the file hasn't changed since
+    #   it was stored.
+    def get(self, filename):
+        key = os.path.abspath(filename)
+        entry = self.entries.get(key)
+        if (entry is None):
+            self.misses += 1
+            return
+
+        try:
+            stat = os.stat(key)
+        except OSError:
+            self.invalidate(filename)
+            self.misses += 1
+            return
+
+        if (entry[0] != (stat.st_mtime_ns, stat.st_size)):
+            logger.debug(f"{filename} changed on disk, dropping it from the cache")
+            self.invalidate(filename)
+            self.misses += 1
+            return
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def invalidate(self, filename):
+        entry = self.entries.pop(os.path.abspath(filename), None)
+        if (entry is not None):
+            self.size -= entry[1]
+
+    def put(self, filename, note):
+        key = os.path.abspath(filename)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            return
+
+        self.invalidate(filename)
+        cost = stat.st_size + ENTRY_OVERHEAD
+        self.entries[key] = ((stat.st_mtime_ns, stat.st_size), cost, note)
+        self.size += cost
+
+        maxsize = self.maxsize
+        if (maxsize is None):
+            maxsize = zlink.globalvars.cache_size
+        while (self.size > maxsize and len(self.entries) > 1):
+            oldkey, oldentry = self.entries.popitem(last=False)
+            self.size -= oldentry[1]
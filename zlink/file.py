@@ -1,75 +1,99 @@
-import argparse
-import curses
+import array
 import datetime
-import minorimpact
 import logging
 import os
 import os.path
 import re
-import subprocess
 import sys
 
-from minorimpact.curses import getstring, highlight
-
 import zlink
 import zlink.globalvars
+import zlink.lazy
+import zlink.reader
+import zlink.render
+
+curses = zlink.lazy.LazyModule("curses")
+minorimpact = zlink.lazy.LazyModule("minorimpact")
+getstring = zlink.lazy.lazyfunction("minorimpact.curses", "getstring")
+highlight = zlink.lazy.lazyfunction("minorimpact.curses", "highlight")
+
+# The kinds of files the file browser knows how to show.
+TEXTFILE = re.compile(r"\.(md|txt|html)$")
 
 class File():
     def __init__(self, filename):
         self.filename = filename
-        self.data = []
-        if (re.search("^\/", filename) is None):
+        if (not filename.startswith("/")):
             filename = os.path.abspath(self.filename)
 
         self.filename = filename
-        with open(self.filename, "r") as f:
-            for line in f:
-                line = line.rstrip()
-                self.data.append(line)
+        # Big files are mapped rather than read, so opening something huge costs nothing
+        #   until it's scrolled through.
+        self.reader = zlink.reader.Reader(self.filename, errors="replace")
+
+        # Where each wrapped row starts: the byte offset of the line it comes from, and which
+        #   piece of that line it is.  Only built as far as something has asked for, and
+        #   thrown away if the width changes.
+        self.width = None
+        self.rowoffsets = array.array('q')
+        self.rowpieces = array.array('q')
+        self.scanned = 0
 
     def cursesoutput(self, stdscr, top = 0):
         stdscr.clear()
-        output = self.output(top)
+        output = self.output(top, curses.LINES - 3)
 
         header = f"{os.path.basename(self.filename)}"
         stdscr.addstr(f"{header}\n", curses.A_BOLD)
-        for i in range(0, len(output)):
-            if (i < top): continue
-            if (i >= (top + curses.LINES - 3 )): continue
-
-            s = output[i]
-            attr = 0
-            if (re.match("^__REVERSE__", s)):
-                s = s.replace("__REVERSE__", "")
-                attr = curses.A_REVERSE
-            elif (re.match("^__BOLD__", s)):
-                s = s.replace("__BOLD__", "")
-                attr = curses.A_BOLD
-
-            s = s[:curses.COLS-1]
-            stdscr.addstr(f"{s}\n", attr)
+        for line in output:
+            line = line.clip(curses.COLS-1)
+            stdscr.addstr(f"{line.text}\n", line.attr)
         footer = f""
         stdscr.addstr(curses.LINES-1, 0, f"{footer}", curses.A_BOLD)
         return
 
+    # Index the rows the file wraps into at 'width' until there are at least 'rows' of
+    #   them (or all of them, if rows is None).  Returns how many rows are indexed, which is
+    #   the total once the end of the file has been reached.
+    def index(self, width, rows=None):
+        if (width != self.width):
+            self.width = width
+            self.rowoffsets = array.array('q')
+            self.rowpieces = array.array('q')
+            self.scanned = 0
+
+        while (self.scanned < len(self.reader) and (rows is None or len(self.rowoffsets) < rows)):
+            offset = self.scanned
+            line, self.scanned = self.reader.getline(offset)
+            pieces = 1
+            if (width > 0 and len(line) > 0):
+                pieces = len(minorimpact.splitstringlen(line, width))
+            for piece in range(pieces):
+                self.rowoffsets.append(offset)
+                self.rowpieces.append(piece)
+        return len(self.rowoffsets)
+
     def lines(self, width=0):
-        output = []
-        for l in self.data:
-            if (width > 0 and len(l)>0):
-                for i in minorimpact.splitstringlen(l, width):
-                    output.append(i)
-            else:
-                output.append(l)
-        return len(output)
+        return self.index(width)
+
+    # Return 'count' rows (or all of them), starting at 'top', as zlink.render.Line objects
+    #   wrapped to fit the screen.
+    def output(self, top = 0, count = None):
+        width = curses.COLS - 2
+        if (count is None):
+            end = self.index(width)
+        else:
+            end = min(self.index(width, top + count), top + count)
 
-    def output(self, top = 0):
         output = []
-        for l in self.data:
-            if (len(l) > 0):
-                for i in minorimpact.splitstringlen(l, curses.COLS-2):
-                    output.append(i)
-            else:
-                output.append(l)
+        line = None
+        line_offset = None
+        for row in range(top, end):
+            if (self.rowoffsets[row] != line_offset):
+                line_offset = self.rowoffsets[row]
+                line = self.reader.getline(line_offset)[0]
+                pieces = minorimpact.splitstringlen(line, width) if (len(line) > 0) else [line]
+            output.append(zlink.render.Line(pieces[self.rowpieces[row]]))
 
         return output
 
@@ -87,7 +111,8 @@ class File():
         selected = 0
         top = 0
         while (True):
-            filesize = self.lines(curses.COLS-2)
+            # Only look far enough ahead to know whether there's more to scroll to.
+            filesize = self.index(curses.COLS-2, top + 2 * curses.LINES)
             stdscr.clear()
 
             self.cursesoutput(stdscr, top)
@@ -168,6 +193,7 @@ class File():
             elif (command == "KEY_HOME"):
                 top = 0
             elif (command == "KEY_END" or command == "G"):
+                filesize = self.lines(curses.COLS-2)
                 top = (filesize - curses.LINES + 3)
             elif (command == "c"):
                 # select text
@@ -237,7 +263,7 @@ class FileBrowser():
         file = None
 
         if (filename is not None):
-            if (re.search("^\/", filename)):
+            if (filename.startswith("/")):
                 cwd = os.path.dirname(filename)
             else:
                 filename = os.path.normpath(os.path.join(cwd, filename))
@@ -377,7 +403,7 @@ def loadfiles(dir):
 
     dirs.extend([f for f in os.listdir(dir) if(os.path.isdir(os.path.join(dir, f)))])
     dirs.sort()
-    files = [f for f in os.listdir(dir) if(os.path.isfile(os.path.join(dir, f)) and re.search("\.(md|txt|html)$",f))]
+    files = [f for f in os.listdir(dir) if(os.path.isfile(os.path.join(dir, f)) and TEXTFILE.search(f))]
     files.sort()
     dirs.extend(files)
     return dirs 
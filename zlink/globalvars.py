@@ -1,12 +1,17 @@
 vars = {}
+cache_size = 64 * 1024 * 1024
 copy = None
+executor = "process"
 filter = ""
+index_filename = '.zlink.db'
 link_note = None
 link_filename = None
 link_text = None
 log_filename = '/tmp/zlink.log'
 log_level = 'DEBUG'
 opened = []
+order_width = 4
 parent_note = None
-reload = False
+spacing = 1
 wikilinks = False
+workers = None
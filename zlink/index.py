@@ -0,0 +1,619 @@
+import concurrent.futures
+import json
+import logging
+import os
+import os.path
+import re
+import sqlite3
+import threading
+
+import zlink
+import zlink.globalvars
+import zlink.lazy
+import zlink.note
+import zlink.parser
+import zlink.reader
+
+# Only needed to start a pool of processes from a program with more than one thread, and to
+#   recognize a note with broken frontmatter.
+multiprocessing = zlink.lazy.LazyModule("multiprocessing")
+yaml = zlink.lazy.LazyModule("yaml")
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever the tables change; an index built by an older version just gets
+#   thrown away and rebuilt.
+SCHEMA_VERSION = 4
+
+# Any of these in a search string means it has to be treated as a regex.
+REGEX_OPERATOR = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+# The notes with a word or tag that contains a given word (passed in twice).
+WORD_QUERY = "SELECT note FROM (SELECT note FROM tokens WHERE token IN (SELECT token FROM vocabulary WHERE instr(token, ?) > 0) UNION SELECT note FROM tags WHERE instr(tag, ?) > 0)"
+
+# Below this many notes, starting up a pool of workers costs more than it saves.
+PARALLEL_THRESHOLD = 100
+
+# Looking for more names than this in the raw text of a note costs more than just parsing
+#   it, so readpending() stops bothering.
+MENTION_LIMIT = 16
+
+# SQLite only takes so many parameters in one statement, so long lists of filenames get
+#   looked up this many at a time.
+PARAMETER_BATCH = 500
+
+# How many parsed notes get written to the index between commits, so a long refresh
+#   doesn't keep the database locked, and anything watching its progress hears about it.
+STORE_BATCH = 500
+
+# One open index per vault directory, so repeated calls to loadnotes() reuse the same
+#   connection.
+indexes = {}
+
+# The Loader refreshing each vault directory in the background, if there is one.
+loaders = {}
+
+# Raised from a progress callback to stop a refresh part way through.  Whatever was stored
+#   before that point is kept.
+class RefreshCancelled(Exception):
+    pass
+
+class NoteIndex():
+    def __init__(self, path="."):
+        self.path = os.path.abspath(path)
+        self.db = None
+        self.persistent = True
+        # Whether this index has been brought up to date with the whole directory yet, and
+        #   the notes it has heard changed since then (or that a Loader was still busy with
+        #   at the time), which get read from disk rather than trusted until they're stored.
+        self.refreshed = False
+        self.stale = set()
+        try:
+            self.db = sqlite3.connect(os.path.join(self.path, zlink.globalvars.index_filename))
+            self.createtables()
+        except sqlite3.Error as e:
+            # Read-only vaults still get an index, it just won't outlive the process.
+            logger.debug(f"can't open index in {self.path}: {e}")
+            self.db = sqlite3.connect(":memory:")
+            self.persistent = False
+            self.createtables()
+
+    def createtables(self):
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if (version != SCHEMA_VERSION):
+            logger.debug(f"index schema {version} is out of date, rebuilding")
+            self.db.execute("DROP TABLE IF EXISTS notes")
+            self.db.execute("DROP TABLE IF EXISTS links")
+            self.db.execute("DROP TABLE IF EXISTS tokens")
+            self.db.execute("DROP TABLE IF EXISTS tags")
+            self.db.execute("DROP TABLE IF EXISTS vocabulary")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            # Hand the space the old tables took back, rather than leaving the file that big.
+            self.db.commit()
+            self.db.execute("VACUUM")
+
+        # Everything else refers to a note by its (integer) 'note' rather than repeating
+        #   its filename in every row.
+        self.db.execute("""CREATE TABLE IF NOT EXISTS notes (
+            note INTEGER PRIMARY KEY,
+            filename TEXT UNIQUE,
+            mtime INTEGER,
+            size INTEGER,
+            ord INTEGER,
+            id TEXT,
+            title TEXT,
+            tags TEXT,
+            links TEXT,
+            backlinks TEXT,
+            refs TEXT,
+            body TEXT)""")
+        # Every link, backlink and reference, keyed on the filename it points to (which
+        #   doesn't have to be a note that exists).  These, tokens and tags are stored in
+        #   the order they're looked up in, so they don't need a rowid or a second index
+        #   for that.
+        self.db.execute("CREATE TABLE IF NOT EXISTS links (target TEXT, source INTEGER, PRIMARY KEY (target, source)) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS links_source ON links (source)")
+        # Which notes each word (from the title, id, body and reference quotes) shows up
+        #   in, and which notes have each tag.  'vocabulary' is every word ever seen, which is
+        #   a lot smaller than the postings to scan when a search only has part of a word.
+        self.db.execute("CREATE TABLE IF NOT EXISTS tokens (token TEXT, note INTEGER, PRIMARY KEY (token, note)) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tokens_note ON tokens (note)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS tags (tag TEXT, note INTEGER, PRIMARY KEY (tag, note)) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tags_note ON tags (note)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS vocabulary (token TEXT PRIMARY KEY)")
+        # Settings that belong to the vault rather than to one run (like --spacing).  These
+        #   can't be read back from the notes, so unlike everything else here they're kept
+        #   when the rest of the index gets rebuilt.
+        self.db.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+
+    def getsetting(self, name, default=None):
+        row = self.db.execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        if (row is None):
+            return default
+        return json.loads(row[0])
+
+    def setsetting(self, name, value):
+        self.db.execute("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)", (name, json.dumps(value)))
+        self.db.commit()
+
+    def get(self, filename):
+        row = self.db.execute("SELECT filename, ord, id, title, tags, links, backlinks, refs, body FROM notes WHERE filename = ?", (filename,)).fetchone()
+        if (row is None):
+            return
+        return makerecord(row)
+
+    def records(self):
+        for row in self.db.execute("SELECT filename, ord, id, title, tags, links, backlinks, refs, body FROM notes ORDER BY filename"):
+            yield makerecord(row)
+
+    # Bring the index up to date before answering anything from it: the first time, with a
+    #   full refresh (unless a Loader already did that), and after that by re-reading just
+    #   the notes it's been told about.  Nothing happens while a Loader is still running,
+    #   since everything it hasn't stored yet gets read from disk anyway.
+    def catchup(self):
+        loader = loaders.get(self.path)
+        if (self.loading()):
+            return
+        if (not self.refreshed and loader is not None and loader.finished):
+            self.refreshed = True
+        if (not self.refreshed):
+            self.refresh()
+        elif (len(self.stale) > 0):
+            self.update(sorted(self.stale))
+
+    # Whether a Loader on another thread is busy refreshing this index.
+    def loading(self):
+        loader = loaders.get(self.path)
+        return (loader is not None and loader.running() and loader.thread is not threading.current_thread())
+
+    # The notes whose rows can't be trusted right now: the ones this index has been told
+    #   changed, and the ones a running Loader hasn't stored yet.
+    def pending(self):
+        pending = set(self.stale)
+        if (self.loading()):
+            pending.update(loaders[self.path].pending())
+        return pending
+
+    # Bring the index up to date with what's on disk.  Only notes whose size or modification
+    #   time changed since the last refresh get parsed again.  progress, if it's set, gets
+    #   called with the number of notes parsed so far and the number that need to be.
+    def refresh(self, progress=None):
+        current, changed, removed = self.scan()
+        if (self.loading()):
+            # A Loader is already parsing these.  Rather than wait for it (or parse them
+            #   twice), read them from disk until it's done.
+            self.stale.update(changed)
+            self.stale.update(removed)
+            return sorted(current)
+
+        logger.debug(f"index refresh: {len(changed)} changed, {len(removed)} removed")
+        self.store(changed, current, removed, progress=progress)
+        self.refreshed = True
+        self.stale.clear()
+        return sorted(current)
+
+    # Compare the notes in the directory with what's in the index.  Returns the (mtime,
+    #   size) of every note, the notes that are new or changed, and the ones that are gone.
+    def scan(self):
+        current = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if (entry.is_file() and zlink.parser.NOTEFILE.search(entry.name)):
+                    stat = entry.stat()
+                    current[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+        indexed = {}
+        for filename, mtime, size in self.db.execute("SELECT filename, mtime, size FROM notes"):
+            indexed[filename] = (mtime, size)
+
+        changed = [f for f in current if (indexed.get(f) != current[f])]
+        removed = [f for f in indexed if (f not in current)]
+        return current, changed, removed
+
+    # Bring just the given notes up to date, for when something else (like a Watcher) already
+    #   knows which files changed and there's no reason to look at the rest of the directory.
+    #   Notes that haven't changed since they were stored don't get parsed again.
+    def update(self, filenames):
+        if (self.loading()):
+            self.stale.update(filenames)
+            return
+
+        current = {}
+        changed = []
+        removed = []
+        for f in filenames:
+            try:
+                stat = os.stat(os.path.join(self.path, f))
+            except FileNotFoundError:
+                removed.append(f)
+                continue
+            current[f] = (stat.st_mtime_ns, stat.st_size)
+            row = self.db.execute("SELECT mtime, size FROM notes WHERE filename = ?", (f,)).fetchone()
+            if (row is None or tuple(row) != current[f]):
+                changed.append(f)
+        self.store(changed, current, removed)
+        self.stale.difference_update(filenames)
+
+    # Parse and save the notes in changed, using the (mtime, size) for each one in current,
+    #   and drop everything in removed.  progress gets called after every note, and committed
+    #   with how many of them have been committed every time a batch is.
+    def store(self, changed, current, removed, progress=None, committed=None):
+        records = iterrecords([os.path.join(self.path, f) for f in changed])
+        try:
+            for i, (f, record) in enumerate(zip(changed, records), 1):
+                if (record is None):
+                    # Whatever was stored before it broke is no use any more, but keep track
+                    #   of the file so it isn't parsed again until it changes.
+                    record = brokenrecord(f)
+                if (record is not None):
+                    self.storerecord(f, current[f], record)
+                else:
+                    self.removerecord(f)
+                if (i % STORE_BATCH == 0):
+                    self.db.commit()
+                    if (committed is not None):
+                        committed(i)
+                if (progress is not None):
+                    progress(i, len(changed))
+        finally:
+            records.close()
+
+        for f in removed:
+            self.removerecord(f)
+
+        if (len(changed) > 0 or len(removed) > 0):
+            self.db.commit()
+        if (committed is not None):
+            committed(len(changed))
+
+    # Drop everything stored about a note, without committing it.
+    def removerecord(self, f):
+        row = self.db.execute("SELECT note FROM notes WHERE filename = ?", (f,)).fetchone()
+        if (row is None):
+            return
+        self.removepostings(row[0])
+        self.db.execute("DELETE FROM notes WHERE note = ?", row)
+
+    def removepostings(self, note):
+        self.db.execute("DELETE FROM links WHERE source = ?", (note,))
+        self.db.execute("DELETE FROM tokens WHERE note = ?", (note,))
+        self.db.execute("DELETE FROM tags WHERE note = ?", (note,))
+
+    # Save one parsed note, whose file has the given (mtime, size), without committing it.
+    #   A note keeps the same number for as long as it keeps the same filename.
+    def storerecord(self, f, stat, record):
+        mtime, size = stat
+        values = (mtime, size, record['order'], record['id'], record['title'], json.dumps(record['tags'], default=str), json.dumps(record['links']),
+            json.dumps(record['backlinks']), json.dumps(record['references']), json.dumps(record['default']))
+        row = self.db.execute("SELECT note FROM notes WHERE filename = ?", (f,)).fetchone()
+        if (row is None):
+            note = self.db.execute("INSERT INTO notes (mtime, size, ord, id, title, tags, links, backlinks, refs, body, filename) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                values + (f,)).lastrowid
+        else:
+            note = row[0]
+            self.db.execute("UPDATE notes SET mtime = ?, size = ?, ord = ?, id = ?, title = ?, tags = ?, links = ?, backlinks = ?, refs = ?, body = ? WHERE note = ?",
+                values + (note,))
+            self.removepostings(note)
+        self.db.executemany("INSERT INTO links (target, source) VALUES (?, ?)", [(target, note) for target in linktargets(record)])
+        tokens = recordtokens(record)
+        self.db.executemany("INSERT INTO tokens (token, note) VALUES (?, ?)", [(token, note) for token in tokens])
+        self.db.executemany("INSERT OR IGNORE INTO vocabulary (token) VALUES (?)", [(token,) for token in tokens])
+        self.db.executemany("INSERT INTO tags (tag, note) VALUES (?, ?)", [(tag, note) for tag in set(str(t).lower() for t in record['tags'])])
+
+    # Parse the notes in pending straight from disk, for the ones the index can't answer
+    #   for yet.  With mentions set, only the notes whose text contains at least one of
+    #   them get parsed (unless there are too many to be worth looking for).
+    def readpending(self, pending, mentions=None):
+        patterns = None
+        if (mentions is not None and len(mentions) <= MENTION_LIMIT):
+            patterns = set()
+            for mention in mentions:
+                patterns.add(mention.encode())
+                patterns.add(mention.replace(' ', '%20').encode())
+        for f in sorted(pending):
+            filename = os.path.join(self.path, f)
+            if (patterns is not None):
+                try:
+                    with zlink.reader.Reader(filename) as reader:
+                        if (not any(reader.data.find(pattern) >= 0 for pattern in patterns)):
+                            continue
+                except OSError:
+                    continue
+            record = loadrecord(filename)
+            if (record is not None):
+                yield record
+
+    # Return the (sorted) list of notes that have a link, backlink or reference pointing
+    #   at filenames (or at any of them, if it's a list).  However many there are, that's
+    #   one pass over the index and one over the notes it can't answer for yet.
+    def referrers(self, filenames):
+        if (isinstance(filenames, str)):
+            filenames = [filenames]
+        self.catchup()
+        targets = sorted(set(os.path.basename(f).replace('%20', ' ') for f in filenames))
+        pending = self.pending()
+        files = set()
+        for i in range(0, len(targets), PARAMETER_BATCH):
+            batch = targets[i:i + PARAMETER_BATCH]
+            rows = self.db.execute(f"SELECT DISTINCT filename FROM notes JOIN links ON links.source = notes.note WHERE target IN ({','.join('?' * len(batch))})", batch)
+            files.update(row[0] for row in rows if (row[0] not in pending))
+        for record in self.readpending(pending, mentions=targets):
+            if (len(linktargets(record).intersection(targets)) > 0):
+                files.add(record['filename'])
+        return sorted(files)
+
+    # Return the (sorted) list of notes that match search_string, using the same rules
+    #   as Note.search().  The word and tag postings narrow things down to the notes that
+    #   could possibly match, and the regex only gets run against those.
+    def search(self, search_string):
+        return sorted(record['filename'] for record in self.query(search_string=search_string))
+
+    # Return the records of every note that could match search_string.  Every run of word
+    #   characters in a plain (no regex operators) search has to appear inside one of the
+    #   note's words or tags, so a note missing any of them can't match.  Anything fancier
+    #   gets checked against every note.
+    def candidates(self, search_string):
+        words = searchwords(search_string)
+        if (len(words) == 0):
+            return self.records()
+
+        query = " INTERSECT ".join([WORD_QUERY] * len(words))
+        parameters = []
+        for word in words:
+            parameters.extend([word, word])
+        rows = self.db.execute(f"SELECT filename, ord, id, title, tags, links, backlinks, refs, body FROM notes WHERE note IN ({query}) ORDER BY filename", parameters)
+        return [makerecord(row) for row in rows]
+
+    # Yield the record of every note (sorted by filename) that has all of tags, links to
+    #   links_to, and matches search_string the same way Note.search() would.  Whatever
+    #   isn't given doesn't narrow things down.  Rows are read as they're needed, so a
+    #   caller that stops early doesn't pay for the rest.  Notes the index can't answer for
+    #   yet (see pending()) are read from disk and come last.
+    def query(self, tags=(), links_to=None, search_string=None):
+        self.catchup()
+        pending = self.pending()
+        conditions = []
+        parameters = []
+        for tag in tags:
+            conditions.append("note IN (SELECT note FROM tags WHERE tag = ?)")
+            parameters.append(str(tag).lower())
+        if (links_to is not None):
+            conditions.append("note IN (SELECT source FROM links WHERE target = ?)")
+            parameters.append(os.path.basename(links_to).replace('%20', ' '))
+        if (search_string is not None):
+            for word in searchwords(search_string):
+                conditions.append(f"note IN ({WORD_QUERY})")
+                parameters.extend([word, word])
+
+        where = ""
+        if (len(conditions) > 0):
+            where = "WHERE " + " AND ".join(conditions)
+        for row in self.db.execute(f"SELECT filename, ord, id, title, tags, links, backlinks, refs, body FROM notes {where} ORDER BY filename", parameters):
+            record = makerecord(row)
+            if (record['filename'] in pending):
+                continue
+            if (search_string is None or matchrecord(record, search_string)):
+                yield record
+
+        mention = os.path.basename(links_to).replace('%20', ' ') if (links_to is not None) else None
+        for record in self.readpending(pending, mentions=[mention] if (mention is not None) else None):
+            if (not set(str(t).lower() for t in tags) <= set(str(t).lower() for t in record['tags'])):
+                continue
+            if (mention is not None and mention not in linktargets(record)):
+                continue
+            if (search_string is None or matchrecord(record, search_string)):
+                yield record
+
+# Refreshes the index for a vault on a thread of its own, with its own connection (sqlite
+#   connections can't be shared between threads), so the browser can be used while a big
+#   vault is read for the first time.
+class Loader():
+    def __init__(self, path="."):
+        self.path = os.path.abspath(path)
+        self.done = 0
+        self.total = None
+        # The notes this loader is going to store, and how many of them have been
+        #   committed, so anything asking the index in the meantime knows which rows it
+        #   can't see yet.
+        self.changed = []
+        self.removed = []
+        self.committed = 0
+        # Set once the scan has worked out what changed.  Until then there's no telling
+        #   which rows are out of date, so anyone asking has to wait for it.
+        self.scanned = threading.Event()
+        self.finished = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def commit(self, committed):
+        self.committed = committed
+
+    # The notes whose rows haven't been committed yet.  Waits for the scan (but not for any
+    #   of the parsing) if it isn't done.
+    def pending(self):
+        self.scanned.wait()
+        return self.changed[self.committed:] + self.removed
+
+    def progress(self, done, total):
+        self.done = done
+        self.total = total
+        if (self.stopped):
+            raise RefreshCancelled()
+
+    def run(self):
+        index = None
+        try:
+            index = NoteIndex(self.path)
+            current, self.changed, self.removed = index.scan()
+            self.scanned.set()
+            self.total = len(self.changed)
+            logger.debug(f"background refresh: {len(self.changed)} changed, {len(self.removed)} removed")
+            index.store(self.changed, current, self.removed, progress=self.progress, committed=self.commit)
+            self.finished = True
+        except RefreshCancelled:
+            logger.debug(f"background refresh of {self.path} stopped after {self.done} notes")
+        except Exception as e:
+            # The next refresh on the main thread will pick up where this one left off.
+            logger.debug(f"background refresh of {self.path} failed: {e}")
+        finally:
+            # Nothing waiting on the scan should wait forever because it failed.
+            self.scanned.set()
+            if (index is not None):
+                index.db.close()
+
+    def running(self):
+        return self.thread.is_alive()
+
+    def stop(self):
+        self.stopped = True
+        self.wait()
+
+    def wait(self):
+        if (self.thread.ident is not None):
+            self.thread.join()
+
+# Start refreshing the index for path in the background, unless that's already happening.
+#   Returns the Loader, or None if the index only lives in memory, since a Loader's own
+#   connection would build a separate copy that nothing else could see.
+def backgroundrefresh(path="."):
+    path = os.path.abspath(path)
+    if (not getindex(path).persistent):
+        return None
+    if (path not in loaders or not loaders[path].running()):
+        loaders[path] = Loader(path)
+        loaders[path].thread.start()
+    return loaders[path]
+
+# Let the index for the directory each of filenames is in (if one has been opened) know
+#   they've changed, so it reads them again before it answers anything about them.
+def touch(filenames):
+    for f in filenames:
+        index = indexes.get(os.path.dirname(os.path.abspath(f)))
+        if (index is not None):
+            index.stale.add(os.path.basename(f))
+
+def getindex(path="."):
+    path = os.path.abspath(path)
+    if (path not in indexes):
+        indexes[path] = NoteIndex(path)
+    return indexes[path]
+
+def linktargets(record):
+    targets = set()
+    for url, text in record['links'] + record['backlinks']:
+        targets.add(url.replace('%20', ' '))
+    for url, text, quote in record['references']:
+        targets.add(url.replace('%20', ' '))
+    return targets
+
+# Parse a list of notes, spreading the work across a pool of processes (or threads, set by
+#   globalvars.executor, for network mounts where the time goes into reading rather than
+#   parsing).  Returns the records in the same order as filenames.
+def parserecords(filenames, workers=None):
+    return list(iterrecords(filenames, workers=workers))
+
+# Same as parserecords(), but hands back each record as soon as it (and every one before
+#   it) is ready.  Anything not parsed yet when the caller stops asking is cancelled.
+def iterrecords(filenames, workers=None):
+    if (workers is None):
+        if (len(filenames) < PARALLEL_THRESHOLD):
+            workers = 1
+        elif (zlink.globalvars.workers is not None):
+            workers = zlink.globalvars.workers
+        else:
+            workers = os.cpu_count() or 1
+
+    if (workers <= 1 or len(filenames) <= 1):
+        for f in filenames:
+            yield loadrecord(f)
+        return
+
+    if (zlink.globalvars.executor == "thread"):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    else:
+        # A forked child gets a copy of every lock another thread (like a Loader, or the
+        #   browser while a Loader runs) happened to be holding, with nobody left to
+        #   release it, so only fork when this is the only thread.
+        context = None
+        if (threading.active_count() > 1):
+            context = multiprocessing.get_context("spawn")
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+    logger.debug(f"parsing {len(filenames)} notes with {workers} {zlink.globalvars.executor} workers")
+    chunksize = max(1, len(filenames) // (workers * 4))
+    try:
+        yield from executor.map(loadrecord, filenames, chunksize=chunksize)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# The parts of a record worth handing to other programs, as something json.dumps() can
+#   write out.
+def jsonrecord(record):
+    return {
+        'filename': record['filename'],
+        'order': record['order'],
+        'id': record['id'],
+        'title': record['title'],
+        'tags': [str(t) for t in record['tags']],
+        'links': [{'url':url, 'text':text} for url, text in record['links']],
+        'backlinks': [{'url':url, 'text':text} for url, text in record['backlinks']],
+        'references': [{'url':url, 'text':text, 'quote':quote} for url, text, quote in record['references']],
+    }
+
+# Every distinct word in the searchable parts of a note.
+def recordtokens(record):
+    tokens = set()
+    for text in [record['title'], record['id']] + record['default'] + [r[2] for r in record['references'] if (r[2] is not None)]:
+        tokens.update(zlink.parser.WORD.findall(text.lower()))
+    return tokens
+
+# The words a note has to contain for search_string to match it, or an empty list if that
+#   can't be worked out without running the regex.
+def searchwords(search_string):
+    if (REGEX_OPERATOR.search(search_string)):
+        return []
+    return sorted(set(zlink.parser.WORD.findall(search_string.lower())))
+
+def makerecord(row):
+    filename, order, id, title, tags, links, backlinks, references, body = row
+    return { 'filename':filename, 'order':order, 'id':id, 'title':title, 'tags':json.loads(tags), 'links':json.loads(links),
+        'backlinks':json.loads(backlinks), 'references':json.loads(references), 'default':json.loads(body) }
+
+def matchrecord(record, search_string):
+    quotes = [r[2] for r in record['references']]
+    return zlink.note.matchnote(search_string, record['title'], record['id'], record['tags'], record['default'], quotes)
+
+# Parse a note into the plain data that gets stored in the index.  Returns None if the
+#   note can't be read or parsed (frontmatter that isn't valid yaml, or isn't a mapping,
+#   or a file that isn't utf-8), so one broken note doesn't stop the rest being indexed.
+def loadrecord(filename):
+    try:
+        return parserecord(filename)
+    except (OSError, zlink.note.InvalidNoteException, yaml.YAMLError, ValueError, TypeError) as e:
+        logger.debug(f"can't index {filename}: {e}")
+
+# The record for a note that can't be parsed: nothing but what its filename says.  Returns
+#   None if the filename doesn't say anything either.
+def brokenrecord(filename):
+    try:
+        order, id, title = zlink.note.parsefilename(filename)
+    except zlink.note.InvalidNoteException:
+        return None
+    return { 'filename':os.path.basename(filename), 'order':order, 'id':id, 'title':title, 'tags':[], 'links':[],
+        'backlinks':[], 'references':[], 'default':[] }
+
+def parserecord(filename):
+    note = zlink.note.Note(filename)
+    return {
+        'filename': os.path.basename(note.filename),
+        'order': note.order,
+        'id': note.id,
+        'title': note.title,
+        'tags': note.frontmatter['tags'],
+        'links': [[l.url, l.text] for l in note.links],
+        'backlinks': [[l.url, l.text] for l in note.backlinks],
+        'references': [[r.link.url, r.link.text, r.text] for r in note.references],
+        'default': note.default,
+    }
+
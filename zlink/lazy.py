@@ -0,0 +1,29 @@
+import importlib
+import types
+
+# Stands in for a module that hasn't been imported yet, and imports it the first time
+#   anything on it gets used.  Importing curses, yaml and minorimpact takes longer than
+#   most of what the command line options actually do, so modules that only need them
+#   for the browser (or for writing a note) shouldn't pay for them up front.
+#
+#   curses = zlink.lazy.LazyModule("curses")
+#
+#   Everything is looked up on (and set on) the real module every time, so anything set
+#   by whoever imported it for real, like curses.LINES and curses.COLS, shows up here too.
+class LazyModule(types.ModuleType):
+    def __getattr__(self, name):
+        return getattr(importlib.import_module(self.__name__), name)
+
+    def __setattr__(self, name, value):
+        setattr(importlib.import_module(self.__name__), name, value)
+
+    def __repr__(self):
+        return f"<lazy module '{self.__name__}'>"
+
+# Return a function that imports 'module' the first time it's called and passes the call on
+#   to 'name' in it, for the places that used 'from module import name'.
+def lazyfunction(module, name):
+    def function(*args, **kwargs):
+        return getattr(importlib.import_module(module), name)(*args, **kwargs)
+    function.__name__ = name
+    return function
@@ -1,44 +1,91 @@
-import argparse
-import curses
+import bisect
+import contextlib
+import copy
 import datetime
-import minorimpact
+import io
 import logging
 import os
 import os.path
 import re
-import subprocess
 import sys
-import yaml
-
-from minorimpact.curses import getstring, highlight
+import tempfile
 
 import zlink
+import zlink.cache
 import zlink.globalvars
+import zlink.index
+import zlink.lazy
+import zlink.notelist
+import zlink.parser
+import zlink.reader
+import zlink.render
+import zlink.watcher
 
 from zlink.file import FileBrowser, File
 
+# Only the browser needs these, and only reading or writing a note needs yaml and hashlib,
+#   so none of them get imported until something uses them.
+curses = zlink.lazy.LazyModule("curses")
+minorimpact = zlink.lazy.LazyModule("minorimpact")
+hashlib = zlink.lazy.LazyModule("hashlib")
+subprocess = zlink.lazy.LazyModule("subprocess")
+yaml = zlink.lazy.LazyModule("yaml")
+getstring = zlink.lazy.lazyfunction("minorimpact.curses", "getstring")
+highlight = zlink.lazy.lazyfunction("minorimpact.curses", "highlight")
+
 logger = logging.getLogger(__name__)
 
+# The C dumper is a lot faster when libyaml is available, and produces the same output.
+def dumper():
+    return getattr(yaml, "CDumper", yaml.Dumper)
+
+# The umask new notes get created with.  The only way to read it is to set it, which changes
+#   it for every thread in the process, so it's done once here, before there are any.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+# The fewest digits the order at the start of a note's filename gets padded to.  Vaults with
+#   bigger orders than that get padded out to whatever their largest order needs, so the
+#   filenames always sort the same way the orders do.
+ORDER_WIDTH = 4
+
+# How long, in milliseconds, the browser waits for a key before checking for changes on
+#   disk.
+WATCH_INTERVAL = 1000
+
+# Parsed notes, shared by everything that needs to look at a note without re-reading it.
+cache = zlink.cache.NoteCache()
+
+# How many times Note.write() actually wrote a file, and how many times it didn't have to
+#   because nothing had changed.
+writestats = {'performed':0, 'skipped':0}
+
+# While inside batchwrites(), the directories that still need to be synced once the batch
+#   is done.
+syncdirs = None
+
 class InvalidNoteException(Exception):
     def __init__(self, message):
         super().__init__(message)
 
 class Link():
+    # A big vault holds hundreds of thousands of these, so they don't get a __dict__, and
+    #   the urls and titles are interned so every link to the same note shares one copy.
+    __slots__ = ('text', 'url')
+
     def __init__(self, url, text=None):
-        m = re.search("\[(.+)\]\((.+)\)", url)
+        m = zlink.parser.LINK.search(url)
         if (m):
-            self.text = m.group(1)
-            self.url = m.group(2)
-        else:
-            self.url = url
-            if (text is None):
-                if (re.search("^\/", url)):
-                    text = os.path.basename(url)
-                else:
-                    text = url
-            self.text = text
+            text = m.group(1)
+            url = m.group(2)
+        elif (text is None):
+            if (url.startswith("/")):
+                text = os.path.basename(url)
+            else:
+                text = url
 
-        self.url = re.sub(' ', '%20', self.url);
+        self.text = intern(text)
+        self.url = intern(url.replace(' ', '%20'))
 
     def __str__(self):
         if (zlink.globalvars.wikilinks == True):
@@ -46,12 +93,18 @@ class Link():
 
         return f"[{self.text}]({self.url})"
 
+    def copy(self):
+        link = Link.__new__(Link)
+        link.text = self.text
+        link.url = self.url
+        return link
+
     def equals(self, testurl):
         ptesturl = None
         if (isinstance(testurl, Link)):
             ptesturl = testurl.url
         else:
-            ptesturl = re.sub(' ', '%20', testurl)
+            ptesturl = testurl.replace(' ', '%20')
 
         if (self.url == testurl or self.url == ptesturl):
             return True
@@ -64,73 +117,76 @@ class Link():
         if (self.text is not None):
             output.append(self.text)
         else:
-            output.append(re.sub('%20', ' ', self.url))
+            output.append(self.url.replace('%20', ' '))
 
         return output
 
     def settext(self, text):
-        self.text = text
+        self.text = intern(text)
 
     def seturl(self, url):
-        purl = re.sub(' ', '%20', url)
-        self.url = purl
+        purl = url.replace(' ', '%20')
+        self.url = intern(purl)
 
 class Note():
+    # Everything that comes from the contents of the file rather than the filename.  None of
+    #   it is read until one of these is asked for.
+    LAZY = ('backlinks', 'default', 'digest', 'frontmatter', 'links', 'parsed', 'references')
+    __slots__ = ('filename', 'id', 'order', 'rendered', 'revision', 'title') + LAZY
+
     def __init__(self, filename):
-        filename = re.sub('%20', ' ', filename)
+        filename = filename.replace('%20', ' ')
 
         self.filename = filename
         self.order, self.id, self.title = self.parseurl()
-        self.frontmatter = {'tags':[]}
-        #self.tags = []
-
-        self.parsed = self.parsefile()
-
-        self.backlinks = self.parselinks("backlinks")
-        self.default = self.parsed['default']
-        self.links = self.parselinks()
-        self.references = self.parsereferences()
+        # Bumped whenever the contents change, so renderlines() knows when to start over.
+        self.revision = 0
+        self.rendered = None
+        for name in Note.LAZY:
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
+
+    # Only called for attributes that haven't been set yet.
+    def __getattr__(self, name):
+        if (name in Note.LAZY):
+            self.load()
+            return object.__getattribute__(self, name)
+        raise AttributeError(f"'Note' object has no attribute '{name}'")
 
     def __str__(self):
-        str = ""
-
-        if (len(self.frontmatter) > 0):
-            str = str + '---\n'
-            #for key in self.frontmatter.keys():
-            #    value = self.frontmatter[key]
-            #    str = str + f"{key}: {value}\n"
-            str = str + yaml.dump(self.frontmatter) + '\n'
-            str = str + '---\n'
-
-        if (len(str) > 0): str = str + "\n"
-        for i in self.default:
-            str = str + i + "\n"
-        str = str + "\n"
-
-        str = str + "### Links\n"
-        for i in self.links:
-            str = f"{str}{i}\n"
-        str = str + "\n"
-
-        str = str + "### Backlinks\n"
-        for i in self.backlinks:
-            str = f"{str}{i}\n"
-        str = str + "\n"
-
-        str = str + "### References\n"
-        for i in self.references:
-            str = f"{str}{i}\n\n"
-        str = str + "\n"
-
-        return str
+        output = io.StringIO()
+        self.writeto(output)
+        return output.getvalue()
+
+    # Return a copy of the note that can be changed without changing this one.  The file
+    #   gets read (once) here if it hasn't been already, so the copies don't each read it.
+    def copy(self):
+        note = Note.__new__(Note)
+        note.filename = self.filename
+        note.order, note.id, note.title = self.order, self.id, self.title
+        note.revision = self.revision
+        note.rendered = self.rendered
+        note.backlinks = [l.copy() for l in self.backlinks]
+        note.default = list(self.default)
+        note.digest = self.digest
+        note.frontmatter = copy.deepcopy(self.frontmatter)
+        note.links = [l.copy() for l in self.links]
+        # Only load() reads this, so there's nothing to change in it.
+        note.parsed = self.parsed
+        note.references = [r.copy() for r in self.references]
+        return note
 
     def addbacklink(self, link):
         if (link is not None):
             self.backlinks.append(link)
+            self.revision += 1
 
     def addlink(self, link):
         if (link is not None):
             self.links.append(link)
+            self.revision += 1
 
     def addnotebacklink(self, note):
         l = Link(note.filename, note.title)
@@ -142,53 +198,38 @@ class Note():
 
     def addreference(self, reference):
         self.references.append(reference)
+        self.revision += 1
 
     def cursesoutput(self, stdscr, selected = 0, top = 0):
-        output = self.output()
+        lines = self.renderlines()
 
         header = f"{self.title}"
         stdscr.addstr( f"{header}\n", curses.A_BOLD)
 
-        for i in range(0, len(output)):
-            s = output[i]
-
-            current = 0
-            m = re.search("^__(\d+)__", s)
-            if (m):
-                current = int(m.group(1))
-                if (current == 1 and selected == 0):
-                    selected = 1
-                s = re.sub(f"__{current}__", "", s)
-                if (current == selected):
-                    s = f"__REVERSE__{s}"
-                    if (len(output) > curses.LINES + top - 3):
-                        top = len(output) - curses.LINES + 7
-                output[i] = s
-
-        for i in range(0, len(output)):
-            s = output[i]
-
-            current = 0
-            attr = 0
-            if (re.match("^__REVERSE__", s)):
-                s = s.replace("__REVERSE__", "")
+        if (selected == 0 and self.linkcount() > 0):
+            selected = 1
+        # Scroll far enough to keep the selected link on the screen.
+        position = self.rendered[2].get(selected)
+        if (position is not None and position >= top + curses.LINES - 3):
+            top = position - curses.LINES + 4
+
+        # Only draw what fits on the screen, with the selected link drawn over the top.
+        for i in range(max(0, top), min(len(lines), top + curses.LINES - 3)):
+            line = lines[i]
+            attr = line.attr
+            if (line.link > 0 and line.link == selected):
                 attr = curses.A_REVERSE
-            elif (re.match("^__BOLD__", s)):
-                s = s.replace("__BOLD__", "")
-                attr = curses.A_BOLD
-
-            if (i < top): continue
-            if (i >= top + curses.LINES - 3): continue
-
-            s = s[:curses.COLS-1]
-            stdscr.addstr(f"{s}\n", attr)
+            stdscr.addstr(f"{line.text}\n", attr)
 
         return selected
 
     def delete(self):
+        cache.invalidate(self.filename)
         os.remove(self.filename)
+        zlink.index.touch([self.filename])
 
     def deletelink(self, link):
+        self.revision += 1
         try:
             self.links.remove(link)
         except ValueError:
@@ -253,106 +294,94 @@ class Note():
         count += len(self.references)
         return count
 
+    # Return the note as a list of zlink.render.Line objects, with the body wrapped to fit
+    #   the screen and each line of a link tagged with that link's number.
     def output(self):
+        Line = zlink.render.Line
         output = []
         current = 0
 
         logger.debug(f"output('{self.filename}')")
         logger.debug(f"frontmatter:{self.frontmatter}")
         if (len(self.frontmatter['tags']) > 0):
-            output.append(f"tags: #" + ",#".join(self.frontmatter['tags']) + "")
-            output.append("")
+            output.append(Line(f"tags: #" + ",#".join(self.frontmatter['tags']) + ""))
+            output.append(Line(""))
 
         if (len(self.frontmatter['tags']) > 0 or self.id is not None):
-            output.append("")
+            output.append(Line(""))
 
         for i in self.default:
             if (i):
                 foo = []
                 foo = minorimpact.splitstringlen(i,curses.COLS - 2)
                 for f in foo:
-                    output.append(f"{f}")
-        output.append("")
+                    output.append(Line(f))
+        output.append(Line(""))
 
-        output.append("### Links")
+        output.append(Line("### Links"))
         for i in self.links:
             current += 1
             for l in i.output():
-                output.append(f"__{current}__{l}")
-        output.append("")
+                output.append(Line(l, link=current))
+        output.append(Line(""))
 
-        output.append("### Backlinks")
+        output.append(Line("### Backlinks"))
         for i in self.backlinks:
             current += 1
             for l in i.output():
-                output.append(f"__{current}__{l}")
-        output.append("")
+                output.append(Line(l, link=current))
+        output.append(Line(""))
 
-        output.append("### References")
+        output.append(Line("### References"))
         for i in self.references:
             current += 1
             ln = 1
             for l in i.output():
                 if (ln == 1):
-                    output.append(f"__{current}__{l}")
+                    output.append(Line(l, link=current))
                 else:
-                    output.append(f"{l}")
+                    output.append(Line(l))
                 ln = ln + 1
 
-            output.append("")
+            output.append(Line(""))
         return output
 
-    def parsefile(self):
-        lines = {}
-        infrontmatter = 0
-
-        logger.debug(f"parsefile({self.filename})")
-
-        try:
-            with open(self.filename, "r") as f:
-                lines = [line.rstrip() for line in f]
-        except FileNotFoundError:
-            pass
+    # Read and parse the file.  Anything that was assigned before the file was read (like a
+    #   new note getting its text before it's written for the first time) is kept.
+    def load(self):
+        assigned = {}
+        for name in Note.LAZY:
+            try:
+                assigned[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
 
-        old_tags = []
-        data = {"default": [], "frontmatter":[]}
-        section = "default"
-        for l in lines:
-            # collect metadata
-            m = re.search('^\[_metadata_:(.+)\]:- +"?([^"]+)"?$', l)
-            if (m):
-                key = m.group(1)
-                value = m.group(2)
-                if (key == "id"):
-                    #self.id = value
-                    pass
-                elif (key == "tags"):
-                    for tag in value.split(","):
-                        old_tags.append(tag.strip())
-                continue
-
-            m = re.search('^---$', l)
-            if (m and infrontmatter < 2):
-                infrontmatter = infrontmatter + 1
-                continue
-
-            m = re.search("^#+ (.+)$", l)
-            if (m):
-                section = m.group(1).lower()
-                if (section not in data):
-                    #print(f"adding new section {section}")
-                    data[section] = []
-                continue
+        self.frontmatter = {'tags':[]}
+        #self.tags = []
+        # A digest of the file as it was read, so write() can tell if anything changed.
+        self.digest = None
 
-            if len(data[section]) == 0 and len(l) == 0:
-                continue
+        self.parsed = self.parsefile()
 
-            if (infrontmatter == 1):
-                data['frontmatter'].append(l)
-                continue
+        self.backlinks = self.parselinks("backlinks")
+        self.default = self.parsed['default']
+        self.links = self.parselinks()
+        self.references = self.parsereferences()
+        for name, value in assigned.items():
+            setattr(self, name, value)
+        self.revision += 1
 
-            data[section].append(l)
+    def parsefile(self):
+        logger.debug(f"parsefile({self.filename})")
 
+        # The lines go straight from the file to the parser, a chunk at a time, so the whole
+        #   text never has to be copied out in one piece.
+        try:
+            with zlink.reader.Reader(self.filename) as reader:
+                self.digest = filedigest(reader.data)
+                data, old_tags = zlink.parser.parselines(reader.lines())
+        except FileNotFoundError:
+            data, old_tags = zlink.parser.parselines([])
 
         if (len(data['frontmatter']) > 0):
             frontmatter = '\n'.join(data['frontmatter'])
@@ -367,12 +396,6 @@ class Note():
             for t in old_tags:
                 self.frontmatter['tags'].append(t)
 
-        # get rid of trailing blank lines
-        for section in data:
-            if (len(data[section]) > 0):
-                while len(data[section][-1]) == 0:
-                    data[section].pop(-1)
-
         return data
 
     def parselinks(self, section="links"):
@@ -380,93 +403,48 @@ class Note():
         if (section not in self.parsed):
             return data
 
-        for l in self.parsed[section]:
-            m = re.search("\[(.+)\]\((.+)\)", l)
-            if (m):
-                text = m.group(1)
-                #url = re.sub('%20',' ', m.group(2))
-                url = m.group(2)
-                data.append(Link(url, text))
-            else:
-                m = re.search("\[\[(.+)\]\]", l)
-                if (m):
-                    url,text = m.group(1).split('|')
-                    data.append(Link(url, text))
+        for url, text in zlink.parser.parselinks(self.parsed[section]):
+            data.append(Link(url, text))
         return data
 
     def parsereferences(self, section="references"):
         data = []
         if (section not in self.parsed):
             return data
-        text = None
-        link = None
-        for l in self.parsed[section]:
-            if (len(l) == 0 or (link is not None and text is not None)):
-                if (link):
-                    data.append(Reference(link, text))
-                text = None
-                link = None
-                continue
-
-            m = re.search("\[(.+)\]\((.+)\)", l)
-            if (m):
-                link = Link(m.group(2), m.group(1))
-            m = re.search("^> (.+)$", l)
-            if (m):
-                text = m.group(1)
-
-        if (link):
-            data.append(Reference(link, text))
+        for url, text, quote in zlink.parser.parsereferences(self.parsed[section]):
+            data.append(Reference(Link(url, text), quote))
         return data
 
     def parseurl(self):
-        order = None
-        title = self.filename
-        id = None
-        m = re.match("(\d+) - (.+) - (.*)\.md$", title)
-        if (m):
-            order = int(m.group(1))
-            id = m.group(2)
-            title = m.group(3)
-        else:
-            raise(InvalidNoteException(f"{self.filename} is not a valid Note"))
-        return order, id, title
+        return parsefilename(self.filename)
 
     def reload(self):
         self.__init__(self.filename)
 
-    def search(self, search_string):
-        # TODO: Make it so any string that starts with '#' will also match tags, even though
-        #       they don't have a 'hashtag' in their raw form.
-        search_string = search_string.lower()
-        m = re.search(search_string, self.title.lower())
-        if (m): return True
-        m = re.search(search_string, self.id.lower())
-        if (m): return True
-        for t in self.frontmatter['tags']:
-            m = re.search(search_string, t.lower())
-            if (m): return True
+    # Return output() cut to the width of the screen.  The list (along with the line each
+    #   link starts on) is only rebuilt when the note changes or the screen is resized.
+    def renderlines(self):
+        key = (self.revision, curses.COLS)
+        if (self.rendered is not None and self.rendered[0] == key):
+            return self.rendered[1]
+
+        lines = []
+        positions = {}
+        for line in self.output():
+            if (line.link > 0):
+                positions.setdefault(line.link, len(lines))
+            lines.append(line.clip(curses.COLS-1))
+        self.rendered = (key, lines, positions)
+        return lines
 
-        for l in self.default:
-            m = re.search(search_string, l.lower())
-            if (m): return True
-
-        for r in self.references:
-            if (r.search(search_string) is True):
-                return True
-        return False
+    def search(self, search_string):
+        return matchnote(search_string, self.title, self.id, self.frontmatter['tags'], self.default, [r.text for r in self.references])
 
     # Change the order value of the current note.
     def updateorder(self, new_order):
-        original_file = self.filename
+        renames, rewrites = renumber({self.filename:new_order})
         self.order = new_order
-        self.filename = "{:04d} - {} - {}.md".format(self.order, self.id, self.title)
-        logger.debug(f"Moved {original_file} to {self.filename}")
-        os.rename(original_file, self.filename)
-        files = loadnotes()
-        for f in files:
-            n = Note(f)
-            n.updatelinks(original_file, self.filename)
+        self.filename = renames.get(self.filename, self.filename)
 
     def updatetags(self, new_tags):
         tags = new_tags.split(",")
@@ -480,40 +458,46 @@ class Note():
         #       altered filename?  If it doesn't, it really, really should.
         original_file = self.filename
         self.title = new_title
-        self.filename = "{:04d} - {} - {}.md".format(self.order, self.id, self.title)
+        self.filename = notefilename(self.order, self.id, self.title)
+        cache.invalidate(original_file)
         os.rename(original_file, self.filename)
+        zlink.index.touch([original_file, self.filename])
 
     # Change any links for this note from 'url' to 'new_url'.
     def updatelinks(self, url, new_url):
         # TODO: Make this work with actual link objects, as opposed to just passing around ghetto urls.
-        new_note = None
         if (new_url is not None):
-            new_note = Note(new_url)
-
-        for l in self.links:
-            if (l.equals(url)):
-                if (new_note is None):
-                    self.links.remove(l)
-                else:
-                    logger.debug('changing link from %s:"%s" to %s:"%s"', l.url, l.text, new_note.filename, new_note.title)
-                    l.seturl(new_note.filename)
-                    l.settext(new_note.title)
-
-        for b in self.backlinks:
-            if (b.equals(url)):
-                if (new_note is None):
-                    self.backlinks.remove(b)
-                else:
-                    logger.debug('changing backlink from %s:"%s" to %s:"%s"', b.url, b.text, new_note.filename, new_note.title)
-                    b.seturl(new_note.filename)
-                    b.settext(new_note.title)
-
-        for r in self.references:
-            if (r.link == url):
+            new_url = new_url.replace('%20', ' ')
+        self.remaplinks({url.replace('%20', ' '):new_url})
+
+    # Change every link that points at one of the files in 'moves' (a dict of old filename
+    #   to new filename, or to None to remove the link), then write the note out once.
+    def remaplinks(self, moves):
+        for section, name in ((self.links, "link"), (self.backlinks, "backlink")):
+            for l in list(section):
+                url = l.url.replace('%20', ' ')
+                if (url not in moves):
+                    continue
+                new_url = moves[url]
                 if (new_url is None):
-                    self.references.remove(r);
+                    section.remove(l)
                 else:
-                    r.link = new_url
+                    new_order, new_id, new_title = parsefilename(new_url)
+                    logger.debug('changing %s from %s:"%s" to %s:"%s"', name, l.url, l.text, new_url, new_title)
+                    l.seturl(new_url)
+                    l.settext(new_title)
+
+        for r in list(self.references):
+            url = r.link.url.replace('%20', ' ')
+            if (url not in moves):
+                continue
+            new_url = moves[url]
+            if (new_url is None):
+                self.references.remove(r);
+            else:
+                new_order, new_id, new_title = parsefilename(new_url)
+                r.link.seturl(new_url)
+                r.link.settext(new_title)
 
         self.write()
 
@@ -573,11 +557,7 @@ class Note():
                     confirm = getstring(stdscr, "Are you sure you want to delete this note? (y/N):", 1)
                     if (confirm == "y"):
                         self.delete()
-                        files = loadnotes()
-                        for f in files:
-                            note = Note(f)
-                            note.updatelinks(original_file, None)
-                        zlink.globalvars.reload = True
+                        relink(original_file, None)
                         return "NEXT"
             elif (command == "KEY_DOWN"):
                 if (select is True):
@@ -628,23 +608,16 @@ class Note():
                     continue
                 return "NEXT"
             elif (command == 'a' or command == 'o'):
+                # The browser knows where this note is in the list, so it makes the new one.
                 new_title = getstring(stdscr, "New Note: ", 80)
                 if (new_title == ""):
                     continue
-                files = loadnotes()
-                new_order = makehole(files, files.index(self.filename) + 1)
-                new_note = newNote(new_order, new_title)
-                zlink.globalvars.reload = True
-                return new_note.filename
+                return ("NEW", new_title, 1)
             elif (command == 'A' or command == 'O'):
                 new_title = getstring(stdscr, "New Note: ", 80)
                 if (new_title == ""):
                     continue
-                files = loadnotes()
-                new_order = makehole(files, files.index(self.filename))
-                new_note = newNote(new_order, new_title)
-                zlink.globalvars.reload = True
-                return new_note.filename
+                return ("NEW", new_title, 0)
             elif (command == "c"):
                 # select text
                 if (select is False):
@@ -664,11 +637,7 @@ class Note():
                 confirm = getstring(stdscr, "Are you sure you want to delete this note? (y/N):", 1)
                 if (confirm == "y"):
                     self.delete()
-                    files = loadnotes()
-                    for f in files:
-                        note = Note(f)
-                        note.updatelinks(original_file, None)
-                zlink.globalvars.reload = True
+                    relink(original_file, None)
                 return "NEXT"
             elif (command == "e"):
                 # Edit note
@@ -706,12 +675,8 @@ class Note():
                 new_title = getstring(stdscr, "New Title: ", 80)
                 original_file = self.filename
                 self.updatetitle(new_title)
-                zlink.globalvars.reload = True
                 self.reload()
-                files = loadnotes()
-                for f in files:
-                    note = Note(f)
-                    note.updatelinks(original_file, self.filename)
+                relink(original_file, self.filename)
             elif (command == 't'):
                 new_tags = getstring(stdscr, "Tags: ")
                 self.updatetags(new_tags)
@@ -728,9 +693,9 @@ class Note():
                         mark_x = select_x
                 else:
                     link = self.getlinkfromselected(selected)
-                    if (link is not None and not re.search("^[^ ]+:", link.url)):
+                    if (link is not None and not zlink.parser.SCHEME.search(link.url)):
                         try:
-                            n = Note(link.url)
+                            n = getnote(link.url)
                         except InvalidNoteException as e:
                             # TODO: hitting the arrow keys when viewing a linked file brings us back here; not
                             #   sure what the most intuitive action is.  Go to the next file? or go the next note?
@@ -741,7 +706,7 @@ class Note():
                         else:
                             # TODO: Just return the note object
                             return n.filename
-                    elif (link is not None and re.search("^[^ ]+:", link.url)):
+                    elif (link is not None and zlink.parser.SCHEME.search(link.url)):
                         subprocess.run(['open', link.url], check=True)
             elif (command == 'KEY_ESCAPE' or command == ''):
                 if (select is True):
@@ -789,26 +754,69 @@ class Note():
                 stdscr.refresh()
                 command = stdscr.getkey()
 
+    # Write the note, in the format it's saved in, to the file object f.  Each section goes
+    #   straight to f, so nothing has to build the whole note up as one string.
+    def writeto(self, f):
+        if (len(self.frontmatter) > 0):
+            f.write('---\n')
+            yaml.dump(self.frontmatter, f, Dumper=dumper())
+            f.write('\n---\n\n')
+
+        f.writelines(f"{i}\n" for i in self.default)
+        f.write("\n")
+
+        f.write("### Links\n")
+        f.writelines(f"{i}\n" for i in self.links)
+        f.write("\n")
+
+        f.write("### Backlinks\n")
+        f.writelines(f"{i}\n" for i in self.backlinks)
+        f.write("\n")
+
+        f.write("### References\n")
+        f.writelines(f"{i}\n\n" for i in self.references)
+        f.write("\n")
+
     def write(self):
         # TODO: Make this compare the filename in the object with the filename that would be generated from the object
         #       data, and if they don't match, you know... fucking fix it.  This shouldn't be happening in updateTitle() or
         #       updateOrder().
         # NOTE: I think i may have looked into this before, but see if there's a way for an object to detect changes to itself and
         #       perform actions if something is different.  That could be a thing, right?
-        with open(self.filename, "w") as f:
-            f.write(self.__str__())
-            f.close()
+        # Anything changed directly (rather than through one of the add or delete methods)
+        #   shows up on screen once it's written.
+        self.revision += 1
+        output = self.__str__()
+        digest = filedigest(output.encode())
+        if (digest == self.digest):
+            logger.debug(f"{self.filename} hasn't changed, not writing")
+            writestats['skipped'] += 1
+            cache.put(self.filename, self.copy())
+            return
+
+        writefile(self.filename, output)
+        self.digest = digest
+        writestats['performed'] += 1
+        zlink.index.touch([self.filename])
+        # What's on disk now matches this object, so the next caller can start from a copy of
+        #   it rather than reading the file again.  It has to be a copy, or anything this
+        #   object's owner changed later (without writing it) would show up there too.
+        cache.put(self.filename, self.copy())
 
 class Reference():
+    __slots__ = ('link', 'text')
+
     def __init__(self, link, text = None):
         self.text = text
         self.link = link
 
+    def copy(self):
+        return Reference(self.link.copy(), self.text)
+
     def __str__(self):
-        str = f"{self.link}"
         if (self.text is not None):
-            str = str + f"\n> {self.text}"
-        return str
+            return f"{self.link}\n> {self.text}"
+        return f"{self.link}"
 
     def output(self):
         output = []
@@ -823,13 +831,19 @@ class Reference():
             if (m): return True
 
 class NoteBrowser():
-    def browse(self, stdscr, filename=None):
+    # files is the list from loadnotes(), if the caller already has it.
+    def browse(self, stdscr, filename=None, files=None):
         stdscr.clear()
 
-        files = loadnotes()
+        if (files is None):
+            files = loadnotes()
+        watcher = zlink.watcher.Watcher(".", match=zlink.parser.NOTEFILE.search)
+        # Only the filenames are needed to draw the list, so read everything else in the
+        #   background and let the first search or filter pick it up.
+        loader = zlink.index.backgroundrefresh()
         note1 = None
         if (filename is not None):
-            note1 = Note(filename)
+            note1 = getnote(filename)
 
         command = None
 
@@ -839,38 +853,54 @@ class NoteBrowser():
         selected = 0
         top = 0
         filebrowser = FileBrowser()
+        # A search or filter asked for while the index was still loading, which gets run
+        #   once it's done rather than holding up the keyboard.
+        queued = None
 
         while (command != "q"):
             stdscr.clear()
 
             status = ""
+            indexing = (loader is not None and loader.running())
+            if (queued is not None and not indexing):
+                action, value = queued
+                queued = None
+                if (action == "search"):
+                    selected = self.search(files, selected, value)
+                elif (action == "filter"):
+                    files, selected = self.filter(files, selected, value)
 
             if (note1 is not None):
                 newnote = note1.view(stdscr)
-                if (zlink.globalvars.reload):
-                    files = loadnotes()
-                    selected = 0
-                    try:
-                        selected = files.index(note1.filename)
-                    except:
-                        pass
-                    zlink.globalvars.reload = False
+                # If note1 was deleted, selected ends up on whatever took its place.
+                files, selected = self.sync(watcher, files, selected, note1.filename)
                 #selected = note1.cursesoutput(stdscr, top=top, selected=selected)
+                if (len(files) == 0):
+                    note1 = None
+                    continue
                 if (newnote):
-                    if (newnote == "PREV"):
+                    if (isinstance(newnote, tuple) and newnote[0] == "NEW"):
+                        # A new note before (offset 0) or after (offset 1) this one.
+                        action, new_title, offset = newnote
+                        if (selected < len(files) and files[selected] == note1.filename):
+                            selected += offset
+                        note1 = newNote(makehole(files, selected), new_title)
+                        files, selected = self.sync(watcher, files, selected, note1.filename)
+                    elif (newnote == "PREV"):
                         selected -= 1
                         if (selected < 0):
                             selected = len(files) - 1
-                        note1 = Note(files[selected])
+                        note1 = getnote(files[selected])
                     elif (newnote == "NEXT"):
-                        selected += 1
+                        if (selected < len(files) and files[selected] == note1.filename):
+                            selected += 1
                         if (selected >= len(files)):
                             selected = 0
-                        note1 = Note(files[selected])
+                        note1 = getnote(files[selected])
                     else:
 
                         try:
-                            note1 = Note(newnote)
+                            note1 = getnote(newnote)
                             selected = files.index(note1.filename)
                         except Exception as e:
                             selected = 0
@@ -880,16 +910,15 @@ class NoteBrowser():
                 continue
                 #status = f"{file_index + 1} of {len(files)}"
             else:
+                files, selected = self.sync(watcher, files, selected)
                 top = gettop(selected, top, len(files)-1)
-                for i in range(0,len(files)):
-                    if (i < top): continue
-                    if (i > (top + curses.LINES - 2 )): continue
+                # Only the filename gets drawn, so there's no reason to open any of these notes
+                #   until one of them is actually selected.
+                max_width = curses.COLS - 6
+                menu_format = "{:" + str(max_width) + "." + str(max_width) + "s}\n"
+                for i in range(top, min(len(files), top + curses.LINES - 1)):
                     f = files[i]
-                    max_width = curses.COLS - 6
-                    menu_item = "{:" + str(max_width) + "." + str(max_width) + "s}\n"
-                    note = Note(f)
-
-                    menu_item = menu_item.format(f)
+                    menu_item = menu_format.format(f)
                     if (i == selected):
                         stdscr.addstr(menu_item, curses.A_REVERSE)
                     else:
@@ -902,6 +931,10 @@ class NoteBrowser():
                 status = f"{status} LINKING"
             if (zlink.globalvars.filter != ""):
                 status = f"{status} FILTERED:'{zlink.globalvars.filter}'"
+            if (indexing and loader.total is not None):
+                status = f"{status} INDEXING {loader.done}/{loader.total}"
+            if (queued is not None):
+                status = f"{status} WAITING TO {queued[0].upper()}:'{queued[1]}'"
 
             if (status):
                 # Make sure a long status doesn't push
@@ -909,7 +942,10 @@ class NoteBrowser():
                 stdscr.addstr(curses.LINES-1,0,status, curses.A_BOLD)
 
             stdscr.refresh()
-            command = stdscr.getkey()
+            command = self.getkey(stdscr, watcher, redraw=indexing)
+            if (command is None):
+                # something changed on disk, redraw
+                continue
 
             if (command == "KEY_UP"):
                 original_selected = selected
@@ -960,11 +996,11 @@ class NoteBrowser():
                 new_title = getstring(stdscr, "New Note: ", 80)
                 if (new_title == ""):
                     continue
+                files, selected = self.sync(watcher, files, selected)
                 new_order = makehole(files, selected+1)
                 new_note = newNote(new_order, new_title)
-                files = loadnotes()
                 note1 = new_note
-                selected = files.index(note1.filename)
+                files, selected = self.sync(watcher, files, selected, note1.filename)
             elif (command == 'A' or command == 'O'):
                 if (zlink.globalvars.filter != ""):
                     continue
@@ -972,11 +1008,11 @@ class NoteBrowser():
                 new_title = getstring(stdscr, "New Note: ", 80)
                 if (new_title == ""):
                     continue
+                files, selected = self.sync(watcher, files, selected)
                 new_order = makehole(files, selected-1)
                 new_note = newNote(new_order, new_title)
-                files = loadnotes()
                 note1 = new_note
-                selected = files.index(note1.filename)
+                files, selected = self.sync(watcher, files, selected, note1.filename)
             elif (command == "KEY_DC" or command == 'd' or command == '^?'):
                 if (zlink.globalvars.filter != ""):
                     continue
@@ -984,44 +1020,33 @@ class NoteBrowser():
                     move = False
                     zlink.globalvars.link_note = None
                     continue
-                note = Note(files[selected])
+                note = getnote(files[selected])
                 original_file = note.filename
                 confirm = getstring(stdscr, "Are you sure you want to delete this note? (y/N):", 1)
                 if (confirm == "y"):
                     note.delete()
-                    files = loadnotes()
-                    for f in files:
-                        note = Note(f)
-                        note.updatelinks(original_file, None)
+                    relink(original_file, None)
+                    files, selected = self.sync(watcher, files, selected, original_file)
             elif (command == "f"):
                 #f = FileBrowser()
                 filebrowser.browse(stdscr)
             elif (command == 'F'):
-                original_selected = selected
-                note = Note(files[selected])
                 new_filter = getstring(stdscr, "filter for: ").lower()
-                if (new_filter != ""):
-                    zlink.globalvars.filter = new_filter
-                if (zlink.globalvars.filter == ""):
+                if (new_filter == ""):
+                    new_filter = zlink.globalvars.filter
+                if (new_filter == ""):
                     continue
 
                 move = False
                 zlink.globalvars.link_note = None
-                files = loadnotes()
-                if (len(files) == 0):
-                    zlink.globalvars.filter = ""
-                    files = loadnotes()
-                    selected = files.index(note.filename)
-                    status = f"{status} NOT FOUND"
+                if (loader is not None and loader.running()):
+                    queued = ("filter", new_filter)
                     continue
-                try:
-                    selected = files.index(note.filename)
-                except ValueError:
-                    selected = 0
+                files, selected = self.filter(files, selected, new_filter)
 
             elif (command == "l"):
                 move = False
-                note = Note(files[selected])
+                note = getnote(files[selected])
                 if (zlink.globalvars.link_note is None):
                     # store this note for linking later
                     zlink.globalvars.link_note = note
@@ -1056,25 +1081,15 @@ class NoteBrowser():
                 if (search == ""):
                     continue
                 search = search.lower()
-                for f in files[selected+1:]:
-                    n = Note(f)
-                    if (n.search(search)):
-                        selected = files.index(f)
-                        break
-
-                if (selected != original_selected):
+                if (loader is not None and loader.running()):
+                    queued = ("search", search)
                     continue
-
-                for f in files[:selected]:
-                    n = Note(f)
-                    if (n.search(search)):
-                        selected = files.index(f)
-                        break
+                selected = self.search(files, selected, search)
             elif (command == "\n"):
                 if (move is True or zlink.globalvars.link_note is not None):
                     # clear any 'special' modes.
                     move = False
-                    note = Note(files[selected])
+                    note = getnote(files[selected])
                     if (note is not None):
                         if (zlink.globalvars.link_note is not None):
                             # link the previous note to the current note
@@ -1085,7 +1100,7 @@ class NoteBrowser():
                             zlink.globalvars.link_note = None
                     continue
 
-                note1 = Note(files[selected])
+                note1 = getnote(files[selected])
                 #selected = 0
                 #top = 0
             elif (command == ''):
@@ -1143,23 +1158,173 @@ class NoteBrowser():
                 stdscr.refresh()
                 command = stdscr.getkey()
 
+        watcher.close()
+
+    # Show just the notes that match new_filter, keeping the selected note selected if it's
+    #   one of them.  If nothing matches, the filter is dropped.  Returns the new list and
+    #   selection.
+    def filter(self, files, selected, new_filter):
+        filename = files[selected] if (selected < len(files)) else None
+        zlink.globalvars.filter = new_filter
+        files = loadnotes()
+        if (len(files) == 0):
+            zlink.globalvars.filter = ""
+            files = loadnotes()
+        selected = files.bisect(filename) if (filename is not None) else 0
+        if (selected >= len(files) or files[selected] != filename):
+            selected = 0
+        return files, selected
+
+    # Return the position of the next note after selected that matches search, wrapping
+    #   around to the first one, or selected if nothing does.
+    def search(self, files, selected, search):
+        index = zlink.index.getindex()
+        positions = sorted(files.index(f) for f in index.search(search) if (f in files))
+        if (len(positions) == 0):
+            return selected
+        i = bisect.bisect_right(positions, selected)
+        return positions[i] if (i < len(positions)) else positions[0]
+
+    # Wait for a key, but give up and return None as soon as the watcher sees something
+    #   change on disk so the list can be redrawn.  With redraw set (to keep a progress
+    #   count moving), give up after WATCH_INTERVAL regardless.
+    def getkey(self, stdscr, watcher, redraw=False):
+        stdscr.timeout(WATCH_INTERVAL)
+        try:
+            while (True):
+                try:
+                    return stdscr.getkey()
+                except curses.error:
+                    if (watcher.changed() or redraw):
+                        return None
+        finally:
+            stdscr.timeout(-1)
+
+    # Apply whatever the watcher has seen since the last time to files.  Returns the new
+    #   list and the position of filename in it (following it if it was renamed), or of
+    #   the note that took its place if it's gone.  Without a filename, the selection
+    #   follows the currently selected note.
+    def sync(self, watcher, files, selected, filename=None):
+        if (filename is None and selected < len(files)):
+            filename = files[selected]
+        events = watcher.events()
+        for event, f, new_filename in events:
+            if (event == "renamed" and f == filename):
+                filename = new_filename
+        if (("rescan", None, None) in events):
+            files = loadnotes()
+        elif (len(events) > 0):
+            files = applyevents(files, events)
+
+        if (filename is not None):
+            selected = files.bisect(filename)
+        if (selected >= len(files)):
+            selected = len(files) - 1
+        if (selected < 0):
+            selected = 0
+        return files, selected
+
+# Return the parsed note for filename, reusing the parse from the last time it was read
+#   if the file hasn't changed since.  Every caller gets its own copy, so changing one
+#   (without writing it) doesn't change what anyone else sees.
+def getnote(filename):
+    filename = filename.replace('%20', ' ')
+    note = cache.get(filename)
+    if (note is None):
+        note = Note(filename)
+        cache.put(note.filename, note)
+    return note.copy()
+
+# Renumber every note so they run from 1 with no gaps or duplicates (or from 'spacing',
+#   'spacing' apart).  Returns the same thing as renumber().
+def defrag(dryrun=False, spacing=1):
+    files = loadnotes()
+    moves = {}
+    for i in range(0, len(files)):
+        moves[files[i]] = (i+1) * spacing
+    # Every note is being renamed anyway, so the padding can shrink back down too.
+    return renumber(moves, dryrun=dryrun, width=orderwidth(len(files) * spacing))
+
+# Spread the notes back out to globalvars.spacing apart, so there's room to insert between
+#   any two of them again.  Returns the same thing as renumber().
+def rebalance(dryrun=False):
+    return defrag(dryrun=dryrun, spacing=max(1, zlink.globalvars.spacing))
+
+# Add a link from source to target for every (source, target) pair, and a backlink from
+#   target to source unless backlinks is False.  Each note is read and written once, no
+#   matter how many links it gets, and links that are already there aren't added again.
+#   Returns a dict counting the links and backlinks added, the links that were already
+#   there and the notes written, along with a list of (source, target, reason) for every
+#   pair that couldn't be linked.
+def addlinks(pairs, backlinks=True):
+    summary = {'links':0, 'backlinks':0, 'existing':0, 'notes':0, 'errors':[]}
+    additions = {}
+    for source, target in pairs:
+        try:
+            source_note = getnote(source)
+            target_note = getnote(target)
+        except InvalidNoteException as e:
+            summary['errors'].append((source, target, str(e)))
+            continue
+        missing = [f for f in (source_note.filename, target_note.filename) if (not os.path.exists(f))]
+        if (len(missing) > 0):
+            summary['errors'].append((source, target, f"{missing[0]} doesn't exist"))
+            continue
+
+        additions.setdefault(source_note.filename, (source_note, [], []))[1].append(target_note)
+        if (backlinks):
+            additions.setdefault(target_note.filename, (target_note, [], []))[2].append(source_note)
+
+    with batchwrites():
+        for note, links, notebacklinks in additions.values():
+            changed = False
+            for section, others, add, count in ((note.links, links, note.addnotelink, 'links'), (note.backlinks, notebacklinks, note.addnotebacklink, 'backlinks')):
+                urls = set(l.url for l in section)
+                for other in others:
+                    url = Link(other.filename).url
+                    if (url in urls):
+                        summary['existing'] += 1
+                        continue
+                    add(other)
+                    urls.add(url)
+                    summary[count] += 1
+                    changed = True
+            if (changed):
+                note.write()
+                summary['notes'] += 1
+    return summary
+
+# Put off syncing directories until the end of a bulk operation, so renaming or rewriting a
+#   few thousand notes costs one directory sync instead of one per file.  Each file is still
+#   written and synced on its own before it replaces the original.
+@contextlib.contextmanager
+def batchwrites():
+    global syncdirs
+    if (syncdirs is not None):
+        # already inside a batch, the outermost one will take care of it
+        yield
+        return
+
+    syncdirs = set()
+    try:
+        yield
+    finally:
+        directories = syncdirs
+        syncdirs = None
+        for directory in directories:
+            syncdir(directory)
+
+# A fingerprint of the contents of a note (anything that supports the buffer protocol, like
+#   bytes or an mmap), for telling whether writing it again would change anything.
+def filedigest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
 # Get the next available open slot in a given list of files after the
 #   given position.
 def gethole(files, position=0):
-    if (len(files) == 0):
-        next_order = 1
-    elif (position < len(files)-1):
-        note = Note(files[position])
-        next_order = note.order + 1
-        for f in files[position:]:
-            n = Note(f)
-            if (n.order > next_order):
-                break
-            next_order = n.order + 1
-    else:
-         note = Note(files[-1])
-         next_order = note.order + 1
-    return next_order
+    if (not isinstance(files, zlink.notelist.NoteList)):
+        files = zlink.notelist.NoteList(files)
+    return files.gethole(position)
 
 # Return the item at the 'top' of the screen, based on what is currently selected.
 def gettop(selected, current_top, maxlength, center=False):
@@ -1175,24 +1340,96 @@ def gettop(selected, current_top, maxlength, center=False):
         top = maxlength - curses.LINES + 2
     return top
 
+# Fold a list of events from a Watcher into files, a NoteList, keeping
+#   anything that doesn't match the current filter out of it.  The cache and the index
+#   only hear about the notes that changed.  Returns the updated list.
+def applyevents(files, events):
+    changed = set()
+    for event, filename, new_filename in events:
+        if (event == "renamed"):
+            files.discard(filename)
+            cache.invalidate(filename)
+            changed.add(filename)
+            filename = new_filename
+
+        changed.add(filename)
+        if (event == "deleted"):
+            files.discard(filename)
+            cache.invalidate(filename)
+        elif (zlink.globalvars.filter == "" or getnote(filename).search(zlink.globalvars.filter)):
+            files.add(filename)
+        else:
+            files.discard(filename)
+
+    if (len(changed) > 0):
+        zlink.index.getindex().update(sorted(changed))
+    return files
+
 def loadnotes():
-    """Read the list of notes from the disk."""
+    """Read the list of notes from the disk, as a NoteList."""
+    if (zlink.globalvars.filter != ""):
+        # Filtering needs the contents of every note, so let the index work out which
+        #   ones have changed since the last time we looked.
+        logger.debug("filtering for %s", zlink.globalvars.filter)
+        index = zlink.index.getindex()
+        index.refresh()
+        return zlink.notelist.NoteList(index.search(zlink.globalvars.filter))
+
+    return scannotes()
+
+# Every note in the current directory as a NoteList, filter or no filter.
+def scannotes():
+    # scandir already knows which entries are files on most systems, so this doesn't have
+    #   to stat every note.
     files = []
-    for f in os.listdir("."):
-        if (os.path.isfile(os.path.join(".", f)) and re.search("^\d+ - .+\.md$",f)):
-            if (zlink.globalvars.filter != ""):
-                note = Note(f)
-                logger.debug("filtering for %s", zlink.globalvars.filter)
-                if (note.search(zlink.globalvars.filter) == False):
-                    continue
-                logger.debug("  found")
-            files.append(f)
+    with os.scandir(".") as entries:
+        for entry in entries:
+            if (entry.is_file() and zlink.parser.NOTEFILE.search(entry.name)):
+                files.append(entry.name)
     #files = [f for f in os.listdir(".") if(os.path.isfile(os.path.join(".", f)) and re.search("^\d+ - .+\.md$",f))]
-    files.sort()
+    files = zlink.notelist.NoteList(files)
+    if (len(files) > 0):
+        # New notes get padded the same as the ones that are already here.
+        zlink.globalvars.order_width = len(zlink.parser.FILENAME.match(files[-1]).group(1))
     return files
 
+# Return the shared copy of a string that shows up over and over, like the filename in a
+#   link.
+def intern(string):
+    if (type(string) is str):
+        return sys.intern(string)
+    return string
+
+# The rules behind Note.search(), split out so they can be applied to data pulled
+#   from the index without parsing the note again.
+def matchnote(search_string, title, id, tags, lines, quotes):
+    # TODO: Make it so any string that starts with '#' will also match tags, even though
+    #       they don't have a 'hashtag' in their raw form.
+    search = re.compile(search_string.lower()).search
+    m = search(title.lower())
+    if (m): return True
+    m = search(id.lower())
+    if (m): return True
+    for t in tags:
+        m = search(t.lower())
+        if (m): return True
+
+    for l in lines:
+        m = search(l.lower())
+        if (m): return True
+
+    for q in quotes:
+        if (q is not None):
+            m = search(q.lower())
+            if (m): return True
+    return False
+
+# Return an order for a new note at 'position' in files (a NoteList, from loadnotes() or
+#   kept up to date with a Watcher), renumbering the notes after it if there isn't a free
+#   one.  Any notes that get moved are moved in files too.
 def makehole(files, position):
-    files = loadnotes()
+    if (not isinstance(files, zlink.notelist.NoteList)):
+        files = zlink.notelist.NoteList(files)
     hole = 1
     if (position < 0):
         position = 0
@@ -1200,52 +1437,213 @@ def makehole(files, position):
     if (position > len(files)):
         position = len(files)
 
+    if (zlink.globalvars.spacing > 1):
+        # With gaps left between notes, there's usually a free order to use without moving
+        #   anything.
+        previous_order = files.order(position-1) if (position > 0) else 0
+        if (position == len(files)):
+            return previous_order + zlink.globalvars.spacing
+        next_order = files.order(position)
+        if (next_order - previous_order > 1):
+            return (previous_order + next_order) // 2
+        logger.debug(f"no room between {previous_order} and {next_order}, moving notes")
+
     if (position > 0):
-        previous_note = Note(files[position-1])
-        hole = previous_note.order+1
+        previous_order, previous_id, previous_title = parsefilename(files[position-1])
+        hole = previous_order+1
 
     # TODO: This moves everything up one, until there's no note where order == position.  However, while it's doing it's thing, each note that's getting moved
     #   temporarily has the same order as the note after it... I think. To be honest, the logic kind of eludes me.  I should probably
     last_order = hole + 2
     logger.debug(f"making a hole at {hole}({position})")
+    moves = {}
     for i in range(position,len(files)):
         logger.debug(f"evaluating postion {i}")
-        n = None
-        try:
-            n = Note(files[i])
-        except:
-            raise Exception(f"Can't open '{files[i]}'")
-
-        logger.debug(f"  {n.order}:{n.filename}")
-        if (n.order <= last_order):
-            original_file = n.filename
+        order, id, title = parsefilename(files[i])
+        logger.debug(f"  {order}:{files[i]}")
+        if (order <= last_order):
             last_order = last_order + 1
-            n.updateorder(last_order)
+            moves[files[i]] = last_order
         else:
             break
 
+    renames, rewrites = renumber(moves)
+    moved(files, renames)
     return hole
 
+# Move the notes in renames (old filename -> new filename) to their new places in files,
+#   rather than reading the whole list again.  Returns files.
+def moved(files, renames):
+    for filename in renames:
+        files.discard(filename)
+    for filename in renames.values():
+        files.add(filename)
+    return files
+
+def notefilename(order, id, title, width=None):
+    if (width is None):
+        width = zlink.globalvars.order_width
+    return "{:0{}d} - {} - {}.md".format(order, width, id, title)
+
+# How many digits the orders in a vault need to be padded to if its largest order is
+#   'largest'.
+def orderwidth(largest):
+    return max(ORDER_WIDTH, len(str(largest)))
+
+# Split a note filename into its order, id and title.
+def parsefilename(filename):
+    m = zlink.parser.FILENAME.match(os.path.basename(filename))
+    if (m is None):
+        raise(InvalidNoteException(f"{filename} is not a valid Note"))
+    return int(m.group(1)), m.group(2), m.group(3)
+
+# Point every link to original_file at new_file, or drop them if new_file is None.  The
+#   index knows which notes link to what, so only those notes get opened and rewritten, and
+#   only they (and the renamed note) get read into the index again afterwards.
+def relink(original_file, new_file):
+    index = zlink.index.getindex()
+    referrers = index.referrers(original_file)
+    for f in referrers:
+        note = getnote(f)
+        note.updatelinks(original_file, new_file)
+    index.update([original_file] + ([new_file] if (new_file is not None) else []) + referrers)
+
+# Give a batch of notes new orders.  'moves' maps filenames to their new order.  All of the
+#   files get renamed first, then every note that links to any of them is rewritten once,
+#   no matter how many of its links changed.  Returns a dict of old -> new filenames and
+#   the list of notes whose links were (or, with dryrun, would be) rewritten.
+#
+#   If the new orders need more digits than the notes are padded to (or 'width' says to
+#   pad them differently), every other note in the vault gets renamed to the new padding
+#   along with them.
+def renumber(moves, dryrun=False, width=None):
+    if (width is None):
+        width = max([zlink.globalvars.order_width] + [orderwidth(order) for order in moves.values()])
+    if (width != zlink.globalvars.order_width):
+        files = scannotes()
+        moves = dict({f: files.order(i) for i, f in enumerate(files)}, **moves)
+
+    renames = {}
+    for filename, new_order in moves.items():
+        filename = filename.replace('%20', ' ')
+        order, id, title = parsefilename(filename)
+        new_file = notefilename(new_order, id, title, width=width)
+        if (new_file != filename):
+            renames[filename] = new_file
+    if (not dryrun):
+        zlink.globalvars.order_width = width
+
+    if (len(renames) == 0):
+        return renames, []
+
+    index = zlink.index.getindex()
+    rewrites = sorted(set(renames.get(f, f) for f in index.referrers(list(renames))))
+
+    if (dryrun):
+        return renames, rewrites
+
+    with batchwrites():
+        # A note can end up with a filename another note is just moving away from, so those
+        #   go through a temporary name until everything else is out of the way.
+        pending = {}
+        for original_file, new_file in renames.items():
+            logger.debug(f"Moved {original_file} to {new_file}")
+            cache.invalidate(original_file)
+            if (new_file in renames):
+                temp_file = f".{new_file}.renumber"
+                os.rename(original_file, temp_file)
+                pending[temp_file] = new_file
+            else:
+                os.rename(original_file, new_file)
+        for temp_file, new_file in pending.items():
+            os.rename(temp_file, new_file)
+        syncdir(os.getcwd())
+
+        for f in rewrites:
+            note = getnote(f)
+            note.remaplinks(renames)
+
+    # Only the notes that moved or had their links rewritten need to be read again.
+    index.update(sorted(set(renames) | set(renames.values()) | set(rewrites)))
+    return renames, rewrites
+
+# Make sure renames and replaced files in directory survive a crash.
+def syncdir(directory):
+    if (syncdirs is not None):
+        syncdirs.add(directory)
+        return
+
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # not every platform lets you sync a directory
+        pass
+    finally:
+        os.close(fd)
+
 def swapnotes(files, original_pos, new_pos):
-    n1 = Note(files[original_pos])
-    n1_order = n1.order
-    n2 = Note(files[new_pos])
-    n2_order = n2.order
-    if (n2_order == n1_order):
+    if (not isinstance(files, zlink.notelist.NoteList)):
+        files = zlink.notelist.NoteList(files)
+    n1 = getnote(files[original_pos])
+    n2 = getnote(files[new_pos])
+    if (n2.order == n1.order):
+        # makehole() moves whatever it renumbers in files itself (which could be every note,
+        #   if they all had to be padded out), so only the note that goes into the hole is
+        #   left to move here, once it's been looked up again.
         if (new_pos < original_pos):
-            n2.updateorder(makehole(files, original_pos))
+            hole = makehole(files, original_pos)
+            orders = [(getnote(files[new_pos]), hole)]
         elif (new_pos > original_pos):
-            n1.updateorder(makehole(files, new_pos))
+            hole = makehole(files, new_pos)
+            orders = [(getnote(files[original_pos]), hole)]
+        else:
+            return files
     else:
-        n1.updateorder(n2_order)
-        n2.updateorder(n1_order)
-    files = loadnotes()
-    return files
+        orders = [(n1, n2.order), (n2, n1.order)]
+
+    renames = {}
+    for note, order in orders:
+        filename = note.filename
+        note.updateorder(order)
+        renames[filename] = note.filename
+    return moved(files, renames)
+
+# Replace filename with data without ever leaving a half-written file behind.  The data goes
+#   to a temporary file in the same directory, which is synced to disk before it's renamed
+#   over the original.
+def writefile(filename, data):
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        mode = os.stat(filename).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+
+    fd, temp_file = tempfile.mkstemp(prefix=f".{os.path.basename(filename)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_file, mode)
+        os.replace(temp_file, filename)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+    syncdir(directory)
 
 def newNote(order, title):
+    if (orderwidth(order) > zlink.globalvars.order_width):
+        renumber({}, width=orderwidth(order))
     today = datetime.datetime.now()
     date = today.strftime("%Y-%m-%d %H-%M")
-    filename = "{:04d} - {} - {}.md".format(order, date, title)
+    filename = notefilename(order, date, title)
     new_note = Note(filename)
     new_note.write()
     return new_note
@@ -0,0 +1,192 @@
+import bisect
+import os.path
+
+import zlink
+import zlink.parser
+
+# The notes in a vault, kept sorted by (order, filename) so that finding a note, the notes
+#   on either side of an order, or the next free order never means walking the list.  It
+#   can be indexed and iterated like the plain list of filenames it replaces, and adding
+#   or removing a note only shuffles one block of SortedBlocks rather than the whole list.
+class NoteList():
+    def __init__(self, filenames=()):
+        self.keys = SortedBlocks((noteorder(f), f) for f in filenames)
+        # How many notes have each order, and the orders that don't have a note right
+        #   after them, which is where the next free order after any point can be found.
+        self.counts = {}
+        for order, f in self.keys:
+            self.counts[order] = self.counts.get(order, 0) + 1
+        self.gaps = SortedBlocks(order for order in self.counts if (order + 1 not in self.counts))
+
+    def __contains__(self, filename):
+        i = self.bisect(filename)
+        return (i < len(self.keys) and self.keys[i][1] == filename)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __getitem__(self, i):
+        if (isinstance(i, slice)):
+            return [f for order, f in self.keys[i]]
+        return self.keys[i][1]
+
+    def __iter__(self):
+        return (f for order, f in self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return f"NoteList({list(self)!r})"
+
+    # Put filename in its place, unless it's already there.
+    def add(self, filename):
+        key = (noteorder(filename), filename)
+        i = self.keys.bisect(key)
+        if (i < len(self.keys) and self.keys[i] == key):
+            return
+        self.keys.add(key)
+
+        order = key[0]
+        self.counts[order] = self.counts.get(order, 0) + 1
+        if (self.counts[order] == 1):
+            if (order + 1 not in self.counts):
+                self.gaps.add(order)
+            if (order - 1 in self.counts):
+                self.gaps.pop(self.gaps.bisect(order - 1))
+
+    # Return where filename is in the list, or where it would go if it isn't.
+    def bisect(self, filename):
+        try:
+            key = (noteorder(filename), filename)
+        except ValueError:
+            return len(self.keys)
+        return self.keys.bisect(key)
+
+    # Take filename out of the list, if it's there.
+    def discard(self, filename):
+        i = self.bisect(filename)
+        if (i == len(self.keys) or self.keys[i][1] != filename):
+            return
+        order, f = self.keys.pop(i)
+
+        self.counts[order] -= 1
+        if (self.counts[order] == 0):
+            del self.counts[order]
+            j = self.gaps.bisect(order)
+            if (j < len(self.gaps) and self.gaps[j] == order):
+                self.gaps.pop(j)
+            if (order - 1 in self.counts):
+                self.gaps.add(order - 1)
+
+    # The first order, from the note at 'position' on, that doesn't have a note.
+    def gethole(self, position=0):
+        if (len(self.keys) == 0):
+            return 1
+        if (position >= len(self.keys)):
+            position = len(self.keys) - 1
+        order = self.keys[max(0, position)][0]
+        return self.gaps[self.gaps.bisect(order)] + 1
+
+    def index(self, filename):
+        i = self.bisect(filename)
+        if (i == len(self.keys) or self.keys[i][1] != filename):
+            raise ValueError(f"{filename} is not in the list")
+        return i
+
+    # Return the last note with an order less than 'order' and the first note with an order
+    #   greater than it.  Either one is None at the ends of the list.
+    def neighbors(self, order):
+        i = self.keys.bisect((order,))
+        j = self.keys.bisect((order + 1,))
+        previous = self[i - 1] if (i > 0) else None
+        next = self[j] if (j < len(self)) else None
+        return previous, next
+
+    def order(self, position):
+        return self.keys[position][0]
+
+# A sorted list split into blocks of about LOAD items, so adding or removing an item only
+#   means inserting into (or popping from) one short block and moving the start of each
+#   block after it along by one, rather than shifting everything after it in one big list.
+class SortedBlocks():
+    LOAD = 1000
+
+    def __init__(self, values=()):
+        values = sorted(values)
+        self.blocks = [values[i:i + self.LOAD] for i in range(0, len(values), self.LOAD)]
+        self.reindex()
+
+    def __getitem__(self, i):
+        if (isinstance(i, slice)):
+            return list(self)[i]
+        if (i < 0):
+            i += self.length
+        if (i < 0 or i >= self.length):
+            raise IndexError("index out of range")
+        b = bisect.bisect_right(self.starts, i) - 1
+        return self.blocks[b][i - self.starts[b]]
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def __len__(self):
+        return self.length
+
+    def add(self, value):
+        if (len(self.blocks) == 0):
+            self.blocks.append([value])
+            self.reindex()
+            return
+        b = min(bisect.bisect_left(self.maxes, value), len(self.blocks) - 1)
+        block = self.blocks[b]
+        bisect.insort(block, value)
+        self.maxes[b] = block[-1]
+        if (len(block) > 2 * self.LOAD):
+            self.blocks[b:b + 1] = [block[:self.LOAD], block[self.LOAD:]]
+            self.reindex()
+            return
+        for j in range(b + 1, len(self.starts)):
+            self.starts[j] += 1
+        self.length += 1
+
+    # Return where value is, or where it would go if it isn't there.
+    def bisect(self, value):
+        b = bisect.bisect_left(self.maxes, value)
+        if (b == len(self.blocks)):
+            return self.length
+        return self.starts[b] + bisect.bisect_left(self.blocks[b], value)
+
+    def pop(self, i):
+        if (i < 0):
+            i += self.length
+        if (i < 0 or i >= self.length):
+            raise IndexError("pop index out of range")
+        b = bisect.bisect_right(self.starts, i) - 1
+        block = self.blocks[b]
+        value = block.pop(i - self.starts[b])
+        if (len(block) == 0):
+            del self.blocks[b]
+            self.reindex()
+            return value
+        self.maxes[b] = block[-1]
+        for j in range(b + 1, len(self.starts)):
+            self.starts[j] -= 1
+        self.length -= 1
+        return value
+
+    # Work out the largest value in each block, and where each one starts, from scratch.
+    def reindex(self):
+        self.maxes = [block[-1] for block in self.blocks]
+        self.starts = []
+        self.length = 0
+        for block in self.blocks:
+            self.starts.append(self.length)
+            self.length += len(block)
+
+def noteorder(filename):
+    m = zlink.parser.FILENAME.search(os.path.basename(filename))
+    if (m is None):
+        raise ValueError(f"{filename} isn't a note")
+    return int(m.group(1))
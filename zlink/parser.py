@@ -0,0 +1,100 @@
+import re
+
+# Every pattern used to pull notes apart, compiled once rather than looked up in the re
+#   module's cache for every line of every note.
+FILENAME = re.compile(r"(\d+) - (.+) - (.*)\.md$")
+LINK = re.compile(r"\[(.+)\]\((.+)\)")
+NOTEFILE = re.compile(r"^\d+ - .+\.md$")
+QUOTE = re.compile(r"^> (.+)$")
+SCHEME = re.compile(r"^[^ ]+:")
+WIKILINK = re.compile(r"\[\[(.+)\]\]")
+WORD = re.compile(r"\w+")
+
+# Works out what kind of line we're looking at in a single pass: an old style metadata
+#   line, a frontmatter fence or a section heading.  Anything that doesn't match is
+#   just content.
+LINE = re.compile(r'\[_metadata_:(?P<key>.+)\]:- +"?(?P<value>[^"]+)"?$|(?P<fence>---)$|#+ (?P<heading>.+)$')
+
+# Split the lines of a note into sections, keyed on the lowercased heading.  Lines before
+#   the first heading go in 'default', and the raw yaml between the '---' fences goes in
+#   'frontmatter'.  Also returns any tags from old style metadata lines.
+def parselines(lines):
+    infrontmatter = 0
+    old_tags = []
+    data = {"default": [], "frontmatter":[]}
+    section = "default"
+    for l in lines:
+        m = LINE.match(l)
+        if (m):
+            if (m.group('key') is not None):
+                # collect metadata
+                if (m.group('key') == "tags"):
+                    for tag in m.group('value').split(","):
+                        old_tags.append(tag.strip())
+                continue
+
+            if (m.group('heading') is not None):
+                section = m.group('heading').lower()
+                if (section not in data):
+                    data[section] = []
+                continue
+
+            if (infrontmatter < 2):
+                infrontmatter = infrontmatter + 1
+                continue
+
+        if len(data[section]) == 0 and len(l) == 0:
+            continue
+
+        if (infrontmatter == 1):
+            data['frontmatter'].append(l)
+            continue
+
+        data[section].append(l)
+
+    # get rid of trailing blank lines
+    for section in data:
+        if (len(data[section]) > 0):
+            while len(data[section][-1]) == 0:
+                data[section].pop(-1)
+
+    return data, old_tags
+
+# Return a (url, text) pair for every markdown or wiki style link in lines.
+def parselinks(lines):
+    data = []
+    for l in lines:
+        m = LINK.search(l)
+        if (m):
+            data.append((m.group(2), m.group(1)))
+        else:
+            m = WIKILINK.search(l)
+            if (m):
+                url,text = m.group(1).split('|')
+                data.append((url, text))
+    return data
+
+# Return a (url, text, quote) tuple for every reference in lines.  A reference is a link
+#   followed by an optional '> quote' line, with a blank line between references.
+def parsereferences(lines):
+    data = []
+    link = None
+    quote = None
+    for l in lines:
+        if (len(l) == 0 or (link is not None and quote is not None)):
+            if (link):
+                data.append((link[0], link[1], quote))
+            link = None
+            quote = None
+            continue
+
+        m = LINK.search(l)
+        if (m):
+            link = (m.group(2), m.group(1))
+        m = QUOTE.match(l)
+        if (m):
+            quote = m.group(1)
+
+    if (link):
+        data.append((link[0], link[1], quote))
+    return data
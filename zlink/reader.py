@@ -0,0 +1,78 @@
+import mmap
+import os
+
+# Files smaller than this are read in one go, since mapping them costs more than it saves.
+#   Anything bigger is mapped, so only the parts that actually get looked at are read.
+MMAP_THRESHOLD = 1024 * 1024
+
+# How much of a file Reader.lines() decodes at a time.
+CHUNK_SIZE = 64 * 1024
+
+# Reads the lines of a file without building a list of all of them first, so whatever is
+#   doing the reading can stop as soon as it has what it needs.
+class Reader():
+    def __init__(self, filename, errors="strict"):
+        self.filename = filename
+        self.errors = errors
+        self.data = None
+        with open(filename, "rb") as f:
+            if (os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD):
+                try:
+                    self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    pass
+            if (self.data is None):
+                self.data = f.read()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.data)
+
+    def close(self):
+        if (isinstance(self.data, mmap.mmap)):
+            self.data.close()
+        self.data = b""
+
+    # Return the line that starts at byte 'offset' (without its line ending or any
+    #   trailing whitespace), and the offset of the line after it.
+    def getline(self, offset):
+        end = self.data.find(b"\n", offset)
+        if (end < 0):
+            end = len(self.data)
+        return self.data[offset:end].decode(errors=self.errors).rstrip(), end + 1
+
+    def lines(self):
+        # Decode a chunk at a time (ending on a line break) and let str.split() find the
+        #   lines, which is a lot faster than looking for them one at a time.
+        offset = 0
+        size = len(self.data)
+        while (offset < size):
+            end = offset + CHUNK_SIZE
+            if (end >= size):
+                end = size
+            else:
+                end = self.data.rfind(b"\n", offset, end)
+                if (end < 0):
+                    # one really long line
+                    end = self.data.find(b"\n", offset + CHUNK_SIZE)
+                    if (end < 0):
+                        end = size
+
+            text = self.data[offset:end].decode(errors=self.errors)
+            if ("\r" in text):
+                # Line endings get converted the same way open() would.  A '\r' right at the
+                #   end of a chunk is just the first half of the '\r\n' the chunk ends on.
+                if (end < size and text.endswith("\r")):
+                    text = text[:-1]
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+            lines = text.split("\n")
+            if (end == size and lines[-1] == ""):
+                lines.pop(-1)
+            for line in lines:
+                yield line.rstrip()
+            offset = end + 1
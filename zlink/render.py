@@ -0,0 +1,24 @@
+# One line of a note or file as it's drawn on the screen.  'attr' is the curses attribute
+#   to draw it with, and 'link' is the number of the link (counting from 1, across links,
+#   backlinks and references) the line belongs to, or 0 if it isn't part of a link.
+class Line():
+    __slots__ = ('attr', 'link', 'text')
+
+    def __init__(self, text, attr=0, link=0):
+        self.text = text
+        self.attr = attr
+        self.link = link
+
+    def __eq__(self, other):
+        if (not isinstance(other, Line)):
+            return NotImplemented
+        return (self.text, self.attr, self.link) == (other.text, other.attr, other.link)
+
+    def __repr__(self):
+        return f"Line({self.text!r}, {self.attr}, {self.link})"
+
+    # The same line, cut down to fit in 'width' columns.
+    def clip(self, width):
+        if (len(self.text) <= width):
+            return self
+        return Line(self.text[:width], self.attr, self.link)
@@ -0,0 +1,183 @@
+import logging
+import os
+import os.path
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+EVENT = struct.Struct("iIII")
+
+# Polling only stats the directory itself each time, since adding, removing or renaming a
+#   note (which is how notes get written) changes its modification time.  A note edited in
+#   place doesn't, so every note gets stat'ed at least this often (in seconds) anyway.
+RESCAN_INTERVAL = 30
+
+# Reports files in a directory that were created, modified, renamed or deleted since the
+#   last time it was asked.  Uses inotify where it's available, and falls back to comparing
+#   the directory against the last time it was looked at everywhere else (or always, with
+#   poll set).
+class Watcher():
+    def __init__(self, path=".", match=None, poll=False):
+        self.path = os.path.abspath(path)
+        self.match = match
+        self.fd = None
+        self.pending = []
+        self.snapshot = None
+        self.mtime = None
+        self.scanned = None
+
+        if (not poll):
+            try:
+                self.fd = inotify(self.path)
+            except OSError as e:
+                logger.debug(f"inotify isn't available ({e}), polling {self.path} instead")
+        if (self.fd is None):
+            self.poll()
+
+    def close(self):
+        if (self.fd is not None):
+            os.close(self.fd)
+            self.fd = None
+
+    # Return True if anything has changed, without losing track of what it was.
+    def changed(self):
+        self.pending.extend(self.read())
+        return (len(self.pending) > 0)
+
+    # Return a list of (event, filename, new_filename) tuples, where event is one of
+    #   'created', 'modified', 'renamed' or 'deleted', and new_filename is only set for
+    #   'renamed'.  A 'rescan' event (with no filename) means events were lost and the
+    #   whole directory needs to be looked at again.  Files that don't pass the match
+    #   function are left out; a file renamed onto a matching name from one that doesn't
+    #   (like a temporary file replacing a note) is reported as 'created'.
+    def events(self):
+        events = self.pending + self.read()
+        self.pending = []
+        return events
+
+    def read(self):
+        if (self.fd is None):
+            return self.poll()
+
+        events = []
+        moves = {}
+        while (True):
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while (offset < len(data)):
+                wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = data[offset:offset+length].rstrip(b"\0").decode(errors="surrogateescape")
+                offset += length
+
+                if (mask & IN_Q_OVERFLOW):
+                    # Lost track of things, so the only safe thing to do is look at everything.
+                    logger.debug("inotify queue overflowed")
+                    events.append(("rescan", None, None))
+                    continue
+                if (mask & IN_CREATE or mask & IN_CLOSE_WRITE):
+                    events.append(("modified" if (mask & IN_CLOSE_WRITE) else "created", name, None))
+                elif (mask & IN_DELETE):
+                    events.append(("deleted", name, None))
+                elif (mask & IN_MOVED_FROM):
+                    moves[cookie] = len(events)
+                    events.append(("deleted", name, None))
+                elif (mask & IN_MOVED_TO):
+                    if (cookie in moves):
+                        i = moves.pop(cookie)
+                        events[i] = ("renamed", events[i][1], name)
+                    else:
+                        events.append(("created", name, None))
+
+        return self.filter(events)
+
+    def filter(self, events):
+        if (self.match is None):
+            return events
+
+        matched = []
+        for event, filename, new_filename in events:
+            if (event == "rescan"):
+                matched.append((event, filename, new_filename))
+            elif (event == "renamed"):
+                if (self.match(filename) and self.match(new_filename)):
+                    matched.append((event, filename, new_filename))
+                elif (self.match(filename)):
+                    matched.append(("deleted", filename, None))
+                elif (self.match(new_filename)):
+                    matched.append(("created", new_filename, None))
+            elif (self.match(filename)):
+                matched.append((event, filename, new_filename))
+        return matched
+
+    def poll(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if (mtime == self.mtime and self.scanned is not None and time.monotonic() - self.scanned < RESCAN_INTERVAL):
+            return []
+        # Anything that changes after this gets a new mtime, so it's picked up next time.
+        self.mtime = mtime
+        self.scanned = time.monotonic()
+
+        current = self.scan()
+        events = []
+        if (self.snapshot is not None):
+            for filename in current:
+                if (filename not in self.snapshot):
+                    events.append(("created", filename, None))
+                elif (current[filename] != self.snapshot[filename]):
+                    events.append(("modified", filename, None))
+            for filename in self.snapshot:
+                if (filename not in current):
+                    events.append(("deleted", filename, None))
+        self.snapshot = current
+        return self.filter(events)
+
+    def scan(self):
+        current = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if (entry.is_file()):
+                    stat = entry.stat()
+                    current[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return current
+
+def inotify(path):
+    # ctypes (and the subprocess module ctypes.util pulls in) is only worth importing once
+    #   something actually wants to watch a directory.
+    import ctypes
+    import ctypes.util
+
+    library = ctypes.util.find_library("c")
+    if (library is None):
+        raise OSError("can't find libc")
+    libc = ctypes.CDLL(library, use_errno=True)
+    if (not hasattr(libc, "inotify_init1")):
+        raise OSError("no inotify")
+
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if (fd < 0):
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    mask = IN_CREATE | IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+    if (libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0):
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, f"can't watch {path}")
+    return fd
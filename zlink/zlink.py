@@ -1,14 +1,19 @@
 #!/usr/bin/env python3
 
 import argparse
-import curses
+import json
 import logging
-import minorimpact
 import os
+import re
 import sys
 
+import zlink.index
+import zlink.lazy
 import zlink.note
 
+# The command line options that don't start the browser never need curses.
+curses = zlink.lazy.LazyModule("curses")
+
 logger = logging.getLogger(__name__)
 
 def highlight(stdscr, select_y, select_x, mark_y, mark_x):
@@ -61,12 +66,58 @@ def highlight(stdscr, select_y, select_x, mark_y, mark_x):
     return selected
 
 def zl(stdscr):
+    loadspacing()
     stdscr.clear()
     files = zlink.note.loadnotes()
     n = zlink.note.NoteBrowser()
-    n.browse(stdscr, filename = files[0])
+    try:
+        n.browse(stdscr, filename = files[0] if (len(files) > 0) else None, files = files)
+    finally:
+        # Don't leave a background index refresh holding up the exit.
+        for loader in list(zlink.index.loaders.values()):
+            loader.stop()
+
+# Use the --spacing this vault was last run with, if it was ever given one.
+def loadspacing():
+    zlink.globalvars.spacing = zlink.index.getindex().getsetting('spacing', zlink.globalvars.spacing)
+
+# 'zlink query': print the notes that match, straight from the index, without starting
+#   up the browser.
+def query(argv):
+    parser = argparse.ArgumentParser(prog="zlink query", description="Print the notes in the current directory that match every option given, one per line.")
+    parser.add_argument('--tag', help = "only notes tagged TAG (can be given more than once)", action='append', default=[])
+    parser.add_argument('--links-to', help = "only notes with a link, backlink or reference to LINKS_TO")
+    parser.add_argument('--search', help = "only notes that match the regex SEARCH, the same way '/' does in the browser")
+    parser.add_argument('--format', help = "print each note's filename, or everything in the index about it as a line of json (default: filename)", choices=['filename', 'json'], default='filename')
+    args = parser.parse_args(argv)
+
+    if (args.search is not None):
+        try:
+            re.compile(args.search)
+        except re.error as e:
+            parser.error(f"invalid --search: {e}")
+
+    # The index only re-reads notes that changed since the last time, so running a
+    #   bunch of queries in a row is cheap.
+    index = zlink.index.getindex()
+    index.refresh()
+    try:
+        for record in index.query(tags=args.tag, links_to=args.links_to, search_string=args.search):
+            if (args.format == 'json'):
+                print(json.dumps(zlink.index.jsonrecord(record)))
+            else:
+                print(record['filename'])
+    except BrokenPipeError:
+        # Whatever was reading our output ('head', for instance) has all it wants.  Point
+        #   stdout somewhere harmless so python doesn't complain flushing it on the way out.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    sys.exit()
 
 def main():
+    # 'query' is the subcommand, unless there's a file called that to open instead.
+    if (len(sys.argv) > 1 and sys.argv[1] == "query" and not os.path.exists("query")):
+        query(sys.argv[2:])
+
     if ('EDITOR' not in os.environ):
         # I like 'vi', so that's the default editor.
         os.environ.setdefault('EDITOR', 'vi')
@@ -77,9 +128,15 @@ def main():
     parser = argparse.ArgumentParser(description="Peruse and maintain a collection of Zettelkasten files in the current directory.")
     parser.add_argument('filename', nargs="?")
     parser.add_argument('--addlink', help = "add a link to ADDLINK to filename")
+    parser.add_argument('--addlinks', help = "add a link for every 'source<TAB>target' line in ADDLINKS ('-' for stdin)")
     parser.add_argument('--nobacklink', help = "when adding a link, don't create a backlink from filename to ADDLINK", action='store_true')
     parser.add_argument('--defrag', help = "update the zettelkasten files to remove any gaps between entries", action='store_true')
+    parser.add_argument('--dry-run', help = "with --defrag or --rebalance, report what would change without touching any files", action='store_true')
+    parser.add_argument('--spacing', help = "leave room for SPACING-1 new notes between each note, so adding a note doesn't have to renumber the ones after it; remembered for later runs (default: 1)", type=int)
+    parser.add_argument('--rebalance', help = "renumber the notes SPACING apart (run it now and then, in the background, to keep room between notes)", action='store_true')
     parser.add_argument('--logging', help = "turn on logging", action='store_true')
+    parser.add_argument('--workers', help = "number of processes to use when reading notes (default: one per cpu)", type=int)
+    parser.add_argument('--threads', help = "read notes with threads instead of processes (faster on network mounts)", action='store_true')
     args = parser.parse_args()
 
     if (args.logging):
@@ -89,6 +146,15 @@ def main():
         logging.basicConfig(format='%(asctime)s: %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p', level=numeric_level, filename=zlink.globalvars.log_filename)
         logger.debug("-------")
         logger.debug(f"log level: {zlink.globalvars.log_level}({numeric_level})")
+    if (args.workers is not None):
+        zlink.globalvars.workers = args.workers
+    if (args.threads):
+        zlink.globalvars.executor = "thread"
+    if (args.spacing is not None):
+        # Remember it, so running the browser later without it keeps leaving the same room.
+        zlink.globalvars.spacing = args.spacing
+        zlink.index.getindex().setsetting('spacing', args.spacing)
+
     if (args.addlink is not None and args.filename is not None):
         # Don't look at anything, just create a link from one file to another.
         note1 = zlink.note.Note(args.filename)
@@ -100,28 +166,53 @@ def main():
             note2.addnotebacklink(note1)
             note2.write()
             print(f"Added backlink {note1.title} to {note2.title}")
-        stdscr.refresh()
         sys.exit()
-    elif (args.defrag is True):
+    elif (args.addlinks is not None):
+        # Every note only gets read and written once, however many of the links are for it.
+        pairs = []
+        errors = 0
+        try:
+            f = sys.stdin if (args.addlinks == "-") else open(args.addlinks, "r")
+            with f:
+                for number, line in enumerate(f, 1):
+                    line = line.rstrip("\r\n")
+                    if (line.strip() == "" or line.startswith("#")):
+                        continue
+                    pair = line.split("\t")
+                    if (len(pair) != 2):
+                        print(f"line {number}: expected 'source<TAB>target', got '{line}'", file=sys.stderr)
+                        errors += 1
+                        continue
+                    pairs.append(pair)
+        except OSError as e:
+            sys.exit(f"can't read {args.addlinks}: {e.strerror}")
+        except UnicodeDecodeError:
+            sys.exit(f"can't read {args.addlinks}: it isn't a text file")
+
+        summary = zlink.note.addlinks(pairs, backlinks=(args.nobacklink is False))
+        for source, target, reason in summary['errors']:
+            print(f"can't link {source} to {target}: {reason}", file=sys.stderr)
+        errors += len(summary['errors'])
+        print(f"Added {summary['links']} links and {summary['backlinks']} backlinks to {summary['notes']} notes", end="")
+        print(f", {summary['existing']} already there, {errors} errors")
+        sys.exit(1 if (errors > 0) else 0)
+    elif (args.defrag is True or args.rebalance is True):
         # Make this fix all the files so that there are no duplicate orders
-        #  and no holes
-        files = zlink.note.loadnotes()
-        for i in range(0, len(files)):
-            n = None
-            try:
-                n = zlink.note.Note(files[i])
-            except:
-                raise Exception(f"Can't open '{files[i]}'")
-
-            if (n.order != i+1):
-                original_file = n.filename
-                n.updateorder(i+1)
-                print(f"Moved {original_file} to {n.filename}")
-                files[i] = n.filename
-
-                for file in files:
-                    scannote = zlink.note.Note(file)
-                    scannote.updatelinks(original_file, n.filename)
+        #  and no holes (or, rebalancing, the same size holes everywhere)
+        if (args.rebalance is True):
+            loadspacing()
+            renames, rewrites = zlink.note.rebalance(dryrun=args.dry_run)
+        else:
+            renames, rewrites = zlink.note.defrag(dryrun=args.dry_run)
+        for original_file in renames:
+            if (args.dry_run):
+                print(f"Would move {original_file} to {renames[original_file]}")
+            else:
+                print(f"Moved {original_file} to {renames[original_file]}")
+        if (args.dry_run):
+            print(f"{len(renames)} notes would be renamed, {len(rewrites)} notes would have their links updated")
+        else:
+            print(f"{len(renames)} notes renamed, {len(rewrites)} notes had their links updated")
         sys.exit()
 
     curses.wrapper(zl)